@@ -3,10 +3,22 @@
 # ============================================================
 
 import os
+import time
+import re
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+import multiprocessing
+import urllib.request
+import urllib.error
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from math import sqrt
 
 import pandas as pd
+from pandas.api.types import union_categoricals
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib as mpl
@@ -16,12 +28,16 @@ import webbrowser
 from openpyxl import load_workbook
 
 # --- ML / MODELOS ---
+import joblib
+import sklearn
 from sklearn.linear_model import LinearRegression
 from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import OneHotEncoder, StandardScaler
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, StandardScaler
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
-from sklearn.ensemble import GradientBoostingRegressor, RandomForestClassifier
+from sklearn.ensemble import (
+    GradientBoostingRegressor, HistGradientBoostingRegressor, RandomForestClassifier
+)
 from sklearn.metrics import (
     mean_absolute_error, mean_squared_error, r2_score,
     accuracy_score, classification_report
@@ -31,6 +47,22 @@ from sklearn.metrics import (
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 
+# --- Snapshots columnares de las hojas (opcional) ---
+try:
+    import pyarrow  # motor Parquet de pandas
+    import pyarrow.parquet as pq
+    PARQUET_DISPONIBLE = True
+except ImportError:
+    # Sin pyarrow se parsea siempre el xlsx
+    PARQUET_DISPONIBLE = False
+
+# --- Exportación xlsx en streaming (opcional) ---
+try:
+    import xlsxwriter
+    XLSXWRITER_DISPONIBLE = True
+except ImportError:
+    XLSXWRITER_DISPONIBLE = False
+
 # ============================================================
 # RUTAS DE ARCHIVOS
 # ============================================================
@@ -43,6 +75,39 @@ RUTA_SALIDA = os.path.join(
     "BD_AURELION_LIMPIO.xlsx"
 )
 
+# Formatos de la BD limpia: xlsx (openpyxl), xlsx en streaming (xlsxwriter),
+# Parquet y CSV (una carpeta con un archivo por tabla)
+FORMATOS_EXPORTACION = {
+    "xlsx": "Excel (.xlsx)",
+    "xlsx_streaming": "Excel en streaming (.xlsx, memoria constante)",
+    "parquet": "Parquet comprimido (un archivo por tabla)",
+    "csv": "CSV (un archivo por tabla)",
+}
+
+# Caché local del libro remoto (se puede mover con la variable AURELION_CACHE)
+CARPETA_CACHE = Path(os.environ.get("AURELION_CACHE", Path.home() / ".aurelion_cache"))
+
+# Modo sin conexión: sirve la última copia buena sin tocar la red
+MODO_OFFLINE = os.environ.get("AURELION_OFFLINE", "0") == "1"
+
+# Precarga en segundo plano de las hojas grandes mientras se muestra el menú
+PRECARGA_SEGUNDO_PLANO = os.environ.get("AURELION_PRECARGA", "1") == "1"
+HOJAS_PRECARGA = ["Ventas", "Detalle_Ventas", "Dataset_Mensual"]
+
+# Parseo de hojas en paralelo (un proceso por hoja) en la carga en frío
+CARGA_PARALELA = os.environ.get("AURELION_CARGA_PARALELA", "0") == "1"
+
+# Los pools de procesos arrancan con "spawn": un fork mientras corre el hilo
+# de precarga podría heredar sus locks tomados
+CONTEXTO_PROCESOS = multiprocessing.get_context("spawn")
+
+# Limpieza y escritura de las tablas en paralelo (un hilo por tabla) al exportar
+EXPORTACION_PARALELA = os.environ.get("AURELION_EXPORTACION_PARALELA", "1") == "1"
+
+# Deduplicación incremental de Ventas / Detalle_Ventas con un índice de hashes
+# (lo actualiza la limpieza desde el menú; el pipeline no escribe a disco)
+DEDUPLICACION_INCREMENTAL = os.environ.get("AURELION_DEDUP_INCREMENTAL", "1") == "1"
+
 # ============================================================
 # HELPERS UX – "VENTANAS" EN CONSOLA
 # ============================================================
@@ -57,64 +122,1527 @@ def pausar_y_volver(mensaje="\nPresione ENTER para volver al menú..."):
     input(mensaje)
     limpiar_pantalla()
 
+# ============================================================
+# CACHÉ LOCAL DEL LIBRO REMOTO (direccionado por contenido)
+# ============================================================
+
+# Libros ya validados en este proceso: {url: (ruta_local, sha256)}
+_libros_validados = {}
+
+# La precarga en segundo plano y el menú pueden pedir el libro a la vez
+_bloqueo_libros = threading.Lock()
+
+
+def _hash_archivo(ruta):
+    sha = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+def _leer_indice_cache():
+    ruta_indice = CARPETA_CACHE / "indice.json"
+    if not ruta_indice.exists():
+        return {}
+    try:
+        with open(ruta_indice, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _guardar_indice_cache(indice):
+    CARPETA_CACHE.mkdir(parents=True, exist_ok=True)
+    ruta_tmp = CARPETA_CACHE / "indice.json.tmp"
+    with open(ruta_tmp, "w", encoding="utf-8") as f:
+        json.dump(indice, f, indent=2)
+    os.replace(ruta_tmp, CARPETA_CACHE / "indice.json")
+
+
+def _ruta_libro_cacheado(sha):
+    return CARPETA_CACHE / "libros" / f"{sha}.xlsx"
+
+
+def _descargar_libro(respuesta):
+    """Guarda el cuerpo de la respuesta en la caché calculando su SHA-256."""
+    carpeta_libros = CARPETA_CACHE / "libros"
+    carpeta_libros.mkdir(parents=True, exist_ok=True)
+
+    sha = hashlib.sha256()
+    fd, ruta_tmp = tempfile.mkstemp(dir=carpeta_libros, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for bloque in iter(lambda: respuesta.read(1024 * 1024), b""):
+                sha.update(bloque)
+                f.write(bloque)
+        destino = _ruta_libro_cacheado(sha.hexdigest())
+        os.replace(ruta_tmp, destino)
+    except BaseException:
+        if os.path.exists(ruta_tmp):
+            os.remove(ruta_tmp)
+        raise
+    return destino, sha.hexdigest()
+
+
+def obtener_libro_local(ruta=None, offline=None):
+    """
+    Devuelve (ruta_local, sha256) del libro Excel.
+    - Rutas locales se usan tal cual.
+    - URLs se guardan en CARPETA_CACHE/libros/<sha256>.xlsx y se revalidan
+      con ETag / Last-Modified: si el servidor responde 304 no se descarga nada.
+    - En modo offline (o si falla la red) se sirve la última copia buena.
+    """
+    with _bloqueo_libros:
+        return _obtener_libro_local(ruta, offline)
+
+
+def _obtener_libro_local(ruta, offline):
+    ruta = RUTA_EXCEL if ruta is None else ruta
+    offline = MODO_OFFLINE if offline is None else offline
+
+    if not str(ruta).startswith(("http://", "https://")):
+        return ruta, _hash_archivo(ruta)
+
+    # Ya validado en este mismo proceso (p. ej. Sprint 3 después de main)
+    if ruta in _libros_validados and _libros_validados[ruta][0].exists():
+        return _libros_validados[ruta]
+
+    indice = _leer_indice_cache()
+    entrada = indice.get(ruta)
+    copia = _copia_cacheada(entrada)
+
+    if offline:
+        if copia is None:
+            raise FileNotFoundError(
+                f"Modo offline: no hay copia local de {ruta} en {CARPETA_CACHE}"
+            )
+        _libros_validados[ruta] = copia
+        return copia
+
+    ruta_local, sha, cabeceras = _revalidar_libro(ruta, entrada, copia)
+    if cabeceras is not None:
+        _registrar_libro(indice, ruta, copia, sha, cabeceras)
+
+    _libros_validados[ruta] = (ruta_local, sha)
+    return ruta_local, sha
+
+
+def _copia_cacheada(entrada):
+    if entrada and _ruta_libro_cacheado(entrada["sha256"]).exists():
+        return _ruta_libro_cacheado(entrada["sha256"]), entrada["sha256"]
+    return None
+
+
+def _revalidar_libro(ruta, entrada, copia):
+    """
+    Pide el libro con cabeceras condicionales. Devuelve (ruta_local, sha256,
+    cabeceras); cabeceras es None cuando se sirve la copia local (304 o sin red).
+    """
+    peticion = urllib.request.Request(ruta)
+    if copia is not None:
+        if entrada.get("etag"):
+            peticion.add_header("If-None-Match", entrada["etag"])
+        if entrada.get("last_modified"):
+            peticion.add_header("If-Modified-Since", entrada["last_modified"])
+
+    try:
+        with urllib.request.urlopen(peticion, timeout=30) as respuesta:
+            ruta_local, sha = _descargar_libro(respuesta)
+            return ruta_local, sha, respuesta.headers
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and copia is not None:
+            return (*copia, None)
+        if copia is None:
+            raise
+        print(f"\n⚠ No se pudo revalidar la BD ({e}). Usando la última copia local.")
+        return (*copia, None)
+    except (urllib.error.URLError, OSError) as e:
+        if copia is None:
+            raise
+        print(f"\n⚠ Sin conexión ({e}). Usando la última copia local.")
+        return (*copia, None)
+
+
+def _registrar_libro(indice, ruta, copia, sha, cabeceras):
+    # Si cambió el contenido se elimina el libro anterior (si nadie más lo usa)
+    if copia is not None and copia[1] != sha:
+        en_uso = {e["sha256"] for url, e in indice.items() if url != ruta}
+        if copia[1] not in en_uso:
+            copia[0].unlink(missing_ok=True)
+
+    indice[ruta] = {
+        "sha256": sha,
+        "etag": cabeceras.get("ETag"),
+        "last_modified": cabeceras.get("Last-Modified"),
+    }
+    _guardar_indice_cache(indice)
+
+# ============================================================
+# TIPOS DE DATOS POR HOJA (menos memoria)
+# ============================================================
+
+# "entero": se reduce al entero más chico que admite los valores
+# "float32": decimales con precisión suficiente para montos y márgenes
+# "category": textos con pocos valores distintos
+ESQUEMAS_HOJAS = {
+    "Clientes": {
+        "id_cliente": "entero", "ciudad": "category",
+    },
+    "Productos": {
+        "id_producto": "entero", "nombre_producto": "category",
+        "categoria_general": "category", "precio_unitario": "entero",
+        "stock_actual": "entero", "stock_minimo": "entero",
+        "costo_producto": "entero", "margen_ganancia": "float32",
+        "porcentaje_margen": "category",
+    },
+    "Ventas": {
+        "id_venta": "entero", "id_cliente": "entero",
+        "medio_pago": "category", "canal_venta": "category",
+        "tipo_cliente": "category", "total_venta": "entero",
+    },
+    "Detalle_Ventas": {
+        "id_venta": "entero", "id_producto": "entero",
+        "cantidad": "entero", "importe": "entero",
+    },
+    "Mapeo_Categorias": {
+        "categoria_general": "category", "prioridad": "entero",
+    },
+    "Dataset_Mensual": {
+        "anio": "entero", "mes": "entero", "id_producto": "entero",
+        "cantidad": "entero", "importe": "entero", "precio": "entero",
+        "costo": "entero", "categoria": "category",
+    },
+}
+
+# Huella de memoria por hoja: {hoja: (bytes_antes, bytes_despues)}
+MEMORIA_HOJAS = {}
+
+
+def aplicar_esquema(df, hoja):
+    """
+    Convierte las columnas de la hoja según ESQUEMAS_HOJAS.
+    Las columnas con nulos o con un tipo inesperado se dejan como están.
+    Devuelve (df_tipado, bytes_antes, bytes_despues).
+    """
+    antes = int(df.memory_usage(deep=True).sum())
+
+    conversiones = {}
+    for columna, tipo in ESQUEMAS_HOJAS.get(hoja, {}).items():
+        if columna not in df.columns:
+            continue
+        serie = df[columna]
+        if tipo == "category":
+            if not isinstance(serie.dtype, pd.CategoricalDtype):
+                conversiones[columna] = serie.astype("category")
+        elif not pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+            continue
+        elif tipo == "entero":
+            if not serie.isnull().any():
+                conversiones[columna] = pd.to_numeric(serie, downcast="integer")
+        elif tipo == "float32":
+            conversiones[columna] = serie.astype("float32")
+
+    if conversiones:
+        df = df.assign(**conversiones)
+    return df, antes, int(df.memory_usage(deep=True).sum())
+
+
+def reporte_memoria(hojas=None):
+    """
+    Muestra y devuelve la memoria de cada hoja (o solo de `hojas`) antes y
+    después de tiparla.
+    """
+    hojas = list(MEMORIA_HOJAS) if hojas is None else hojas
+    filas = [
+        {
+            "hoja": hoja,
+            "antes_MB": antes / 1024 ** 2,
+            "despues_MB": despues / 1024 ** 2,
+            "ahorro_%": 100 * (1 - despues / antes) if antes else 0.0,
+        }
+        for hoja, (antes, despues) in MEMORIA_HOJAS.items() if hoja in hojas
+    ]
+    reporte = pd.DataFrame(filas, columns=["hoja", "antes_MB", "despues_MB", "ahorro_%"])
+    print("\n=== MEMORIA POR HOJA (tipos por defecto → esquema) ===")
+    print(reporte.round(2).to_string(index=False))
+    return reporte
+
+
+def _reportar_memoria_nuevas(reportadas):
+    """Muestra la memoria de las hojas cargadas desde el último reporte."""
+    nuevas = [hoja for hoja in MEMORIA_HOJAS if hoja not in reportadas]
+    if nuevas:
+        reporte_memoria(nuevas)
+        reportadas.update(nuevas)
+
+# ============================================================
+# SNAPSHOTS PARQUET DE LAS HOJAS (por huella del libro)
+# ============================================================
+
+def _version_snapshots():
+    """
+    Hash de ESQUEMAS_HOJAS y de la versión mayor de pandas: si cambia el
+    esquema (o el formato de pandas) los snapshots viejos dejan de usarse.
+    """
+    contenido = json.dumps([ESQUEMAS_HOJAS, pd.__version__.split(".")[0]], sort_keys=True)
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()[:12]
+
+
+def _ruta_snapshot(huella, hoja):
+    return CARPETA_CACHE / "snapshots" / f"{huella}_{_version_snapshots()}" / f"{hoja}.parquet"
+
+
+def _leer_snapshot(huella, hoja):
+    """Devuelve la hoja desde su snapshot Parquet, o None si no existe."""
+    if not PARQUET_DISPONIBLE:
+        return None
+    ruta = _ruta_snapshot(huella, hoja)
+    if not ruta.exists():
+        return None
+    try:
+        df = pd.read_parquet(ruta)
+    except Exception:
+        # Snapshot corrupto o de otra versión: se vuelve a parsear
+        return None
+
+    # El snapshot ya está tipado; la memoria original se guardó al crearlo
+    ruta_memoria = ruta.with_suffix(".memoria.json")
+    if ruta_memoria.exists():
+        with open(ruta_memoria, encoding="utf-8") as f:
+            MEMORIA_HOJAS[hoja] = tuple(json.load(f))
+    return df
+
+
+def _guardar_snapshot(huella, hoja, df):
+    """
+    Escribe el snapshot y elimina los de huellas o esquemas anteriores (obsoletos).
+    Devuelve True si el snapshot quedó escrito.
+    """
+    if not PARQUET_DISPONIBLE:
+        return False
+    ruta = _ruta_snapshot(huella, hoja)
+    try:
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        ruta_tmp = ruta.with_suffix(".tmp")
+        df.to_parquet(ruta_tmp, index=False)
+        os.replace(ruta_tmp, ruta)
+        if hoja in MEMORIA_HOJAS:
+            with open(ruta.with_suffix(".memoria.json"), "w", encoding="utf-8") as f:
+                json.dump(list(MEMORIA_HOJAS[hoja]), f)
+    except Exception as e:
+        print(f"\n⚠ No se pudo guardar el snapshot de {hoja}: {str(e)}")
+        return False
+
+    for carpeta in ruta.parent.parent.iterdir():
+        if carpeta.is_dir() and carpeta != ruta.parent:
+            shutil.rmtree(carpeta, ignore_errors=True)
+    return True
+
 # ============================================================
 # CARGA INICIAL DE DATOS (DEMO 1 / DEMO 2)
 # ============================================================
 
-def cargar_datos():
-    df_cliente = pd.read_excel(RUTA_EXCEL, sheet_name="Clientes")
-    df_detalle = pd.read_excel(RUTA_EXCEL, sheet_name="Detalle_Ventas")
-    df_producto = pd.read_excel(RUTA_EXCEL, sheet_name="Productos")
-    df_ventas = pd.read_excel(RUTA_EXCEL, sheet_name="Ventas")
-    df_map = pd.read_excel(RUTA_EXCEL, sheet_name="Mapeo_Categorias")
-    # El Dataset_Mensual se usa solo en Sprint 3 (se carga allá)
-    return df_cliente, df_detalle, df_producto, df_ventas, df_map
+HOJAS_DEMO = ["Clientes", "Detalle_Ventas", "Productos", "Ventas", "Mapeo_Categorias"]
+
+
+def _parsear_hoja_en_proceso(ruta_local, huella, hoja, carpeta_cache):
+    """
+    Trabajo de cada proceso en la carga paralela.
+    Si hay Parquet, deja la hoja como snapshot y devuelve solo su nombre:
+    el proceso principal la lee del disco en vez de recibir el DataFrame
+    serializado con pickle.
+    """
+    # Con "spawn" el proceso no hereda los globales: usa la caché del principal
+    global CARPETA_CACHE
+    CARPETA_CACHE = carpeta_cache
+    df, antes, despues = aplicar_esquema(pd.read_excel(ruta_local, sheet_name=hoja), hoja)
+    MEMORIA_HOJAS[hoja] = (antes, despues)
+    if _guardar_snapshot(huella, hoja, df):
+        df = None
+    return hoja, df, antes, despues
+
+
+def _parsear_hojas_en_paralelo(ruta_local, huella, hojas):
+    tablas = {}
+    with ProcessPoolExecutor(max_workers=min(len(hojas), os.cpu_count() or 1),
+                             mp_context=CONTEXTO_PROCESOS) as ejecutor:
+        futuros = [
+            ejecutor.submit(_parsear_hoja_en_proceso, ruta_local, huella, hoja, CARPETA_CACHE)
+            for hoja in hojas
+        ]
+        for futuro in futuros:
+            hoja, df, antes, despues = futuro.result()
+            MEMORIA_HOJAS[hoja] = (antes, despues)
+            tablas[hoja] = _leer_snapshot(huella, hoja) if df is None else df
+    return tablas
+
+
+def cargar_hojas(hojas, ruta=None, paralelo=None):
+    """
+    Abre el libro UNA sola vez (desde la caché local, un unzip) y parsea
+    todas las hojas pedidas en la misma pasada.
+    Las hojas que ya tienen snapshot Parquet para la huella del libro se
+    leen de ahí sin tocar el XML. Cada hoja sale tipada con ESQUEMAS_HOJAS.
+    Con paralelo=True (o AURELION_CARGA_PARALELA=1) las hojas pendientes
+    se parsean a la vez en un pool de procesos.
+    Devuelve un dict {nombre_hoja: DataFrame}.
+    """
+    paralelo = CARGA_PARALELA if paralelo is None else paralelo
+    ruta_local, huella = obtener_libro_local(ruta)
+
+    tablas = {}
+    pendientes = []
+    for hoja in hojas:
+        df = _leer_snapshot(huella, hoja)
+        if df is None:
+            pendientes.append(hoja)
+        else:
+            tablas[hoja] = df
+
+    if paralelo and len(pendientes) > 1:
+        tablas.update(_parsear_hojas_en_paralelo(ruta_local, huella, pendientes))
+    elif pendientes:
+        with pd.ExcelFile(ruta_local) as libro:
+            parseadas = pd.read_excel(libro, sheet_name=pendientes)
+        for hoja, df in parseadas.items():
+            df, antes, despues = aplicar_esquema(df, hoja)
+            MEMORIA_HOJAS[hoja] = (antes, despues)
+            _guardar_snapshot(huella, hoja, df)
+            tablas[hoja] = df
+
+    return {hoja: tablas[hoja] for hoja in hojas}
+
+
+class ContextoDatos:
+    """
+    Dueño único de las hojas leídas del libro.
+    Demo 2 y Sprint 3 reciben los MISMOS DataFrames: lo que ya está en
+    memoria no se vuelve a leer. Las funciones de limpieza no modifican
+    las tablas que reciben.
+    Cada hoja se parsea recién cuando alguien la pide (propiedades
+    clientes, productos, ventas, detalle, mapeo, mensual) y queda memorizada.
+    Con precargar() las hojas se pueden ir leyendo en segundo plano.
+    """
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta
+        self.hojas = {}
+        self._precargas = {}
+        self._ejecutor = None
+        self._bloqueo = threading.Lock()
+
+    def precargar(self, hojas):
+        """
+        Lee las hojas en un hilo aparte, una por una y en el orden recibido
+        (prioridad). Quien pida una hoja antes de tiempo espera solo por ella.
+        """
+        with self._bloqueo:
+            if self._ejecutor is None:
+                self._ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="aurelion-precarga")
+            for hoja in hojas:
+                if hoja not in self.hojas and hoja not in self._precargas:
+                    self._precargas[hoja] = self._ejecutor.submit(self._precargar_hoja, hoja)
+
+    def _precargar_hoja(self, hoja):
+        df = cargar_hojas([hoja], self.ruta)[hoja]
+        with self._bloqueo:
+            self.hojas.setdefault(hoja, df)
+        return df
+
+    def detener_precarga(self):
+        """Cancela las precargas que todavía no empezaron."""
+        with self._bloqueo:
+            if self._ejecutor is not None:
+                self._ejecutor.shutdown(wait=False, cancel_futures=True)
+                self._ejecutor = None
+            self._precargas.clear()
+
+    def cargar(self, hojas):
+        """Carga en una sola pasada solo las hojas que aún no están en memoria."""
+        for hoja in hojas:
+            with self._bloqueo:
+                futuro = self._precargas.pop(hoja, None)
+            # Si la precarga ya empezó se espera; si no, se lee aquí mismo
+            if futuro is not None and not futuro.cancel():
+                try:
+                    futuro.result()
+                except Exception:
+                    pass  # se reintenta abajo y el error se ve en primer plano
+
+        faltantes = [hoja for hoja in hojas if hoja not in self.hojas]
+        if faltantes:
+            leidas = cargar_hojas(faltantes, self.ruta)
+            with self._bloqueo:
+                for hoja, df in leidas.items():
+                    self.hojas.setdefault(hoja, df)
+        return [self.hojas[hoja] for hoja in hojas]
+
+    def obtener(self, hoja):
+        return self.cargar([hoja])[0]
+
+    @property
+    def clientes(self):
+        return self.obtener("Clientes")
+
+    @property
+    def productos(self):
+        return self.obtener("Productos")
+
+    @property
+    def ventas(self):
+        return self.obtener("Ventas")
+
+    @property
+    def detalle(self):
+        return self.obtener("Detalle_Ventas")
+
+    @property
+    def mapeo(self):
+        return self.obtener("Mapeo_Categorias")
+
+    @property
+    def mensual(self):
+        return self.obtener("Dataset_Mensual")
+
+
+# Contexto compartido por el menú principal y el Sprint 3
+contexto_datos = ContextoDatos()
+
+
+def cargar_datos(incluir_mensual=False):
+    hojas = list(HOJAS_DEMO)
+    if incluir_mensual:
+        hojas.append("Dataset_Mensual")
+
+    # El Dataset_Mensual se usa solo en Sprint 3 (se pide con incluir_mensual=True)
+    return tuple(contexto_datos.cargar(hojas))
 
 # ============================================================
-# FUNCIONES DE LIMPIEZA + ANÁLISIS (DEMO 2)
+# LECTURA POR BLOQUES (hojas grandes: Ventas / Detalle_Ventas)
 # ============================================================
 
-def limpiar_analizar_clientes(df_cliente, mostrar_graficos=True):
-    filas_originales = len(df_cliente)
-    nulos_totales = df_cliente.isnull().sum().sum()
-    duplicados_iniciales = df_cliente.duplicated().sum()
+# Filas por bloque al leer hojas en streaming
+TAMANO_BLOQUE = 50_000
 
-    print("Registros nulos por columna en Clientes:")
-    print(df_cliente.isnull().sum())
 
-    columnas_redundantes = ['email', 'telefono']
-    columnas_existentes = [col for col in columnas_redundantes if col in df_cliente.columns]
+def leer_hoja_por_bloques(hoja, tamano_bloque=TAMANO_BLOQUE, ruta=None):
+    """
+    Lee una hoja con openpyxl en modo read-only y va entregando DataFrames
+    de `tamano_bloque` filas ya tipados (ESQUEMAS_HOJAS), sin materializar
+    la hoja completa. El índice de cada bloque es la posición global de la fila.
+    """
+    ruta_local, _ = obtener_libro_local(ruta)
+    libro = load_workbook(ruta_local, read_only=True, data_only=True)
+    try:
+        filas = libro[hoja].iter_rows(values_only=True)
+        columnas = [str(c) for c in next(filas)]
+        n_columnas = len(columnas)
+
+        inicio = 0
+        bloque = []
+        for fila in filas:
+            if all(valor is None for valor in fila):
+                continue
+            if len(fila) != n_columnas:
+                fila = tuple(fila[:n_columnas]) + (None,) * (n_columnas - len(fila))
+            bloque.append(fila)
+            if len(bloque) >= tamano_bloque:
+                yield _bloque_a_dataframe(bloque, columnas, inicio, hoja)
+                inicio += len(bloque)
+                bloque = []
+        if bloque:
+            yield _bloque_a_dataframe(bloque, columnas, inicio, hoja)
+    finally:
+        libro.close()
+
+
+def _bloque_a_dataframe(filas, columnas, inicio, hoja):
+    df = pd.DataFrame.from_records(filas, columns=columnas)
+    df.index = pd.RangeIndex(inicio, inicio + len(df))
+    df, _, _ = aplicar_esquema(df.infer_objects(), hoja)
+    return df
+
+
+def _concatenar_bloques(partes):
+    """
+    pd.concat que conserva las columnas category aunque cada bloque
+    haya armado sus propias categorías.
+    """
+    categoricas = [
+        col for col in partes[0].columns
+        if isinstance(partes[0][col].dtype, pd.CategoricalDtype)
+    ]
+    if categoricas:
+        tipos = {
+            col: pd.CategoricalDtype(
+                union_categoricals([parte[col] for parte in partes], sort_categories=True).categories
+            )
+            for col in categoricas
+        }
+        partes = [parte.astype(tipos) for parte in partes]
+    return pd.concat(partes)
+
+
+def _serie_canonica(serie):
+    """
+    Misma fila -> mismo hash en cualquier bloque: los números pasan a float64
+    (int8, int16 o float64 según el bloque), las fechas a datetime64[ns] y
+    el resto a texto.
+    """
+    if pd.api.types.is_bool_dtype(serie) or pd.api.types.is_numeric_dtype(serie):
+        return serie.astype("float64")
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie.astype("datetime64[ns]")
+    if serie.dtype == object:
+        try:
+            return pd.to_numeric(serie).astype("float64")
+        except (ValueError, TypeError):
+            pass
+    return serie.astype("string")
+
+
+def _hash_filas_canonico(df):
+    """
+    Hash de 64 bits por fila, independiente de los dtypes de cada bloque.
+    Los nulos (NaN, NaT, None) de una columna dan todos el mismo hash.
+    """
+    total = np.zeros(len(df), dtype=np.uint64)
+    for columna in df.columns:
+        serie = _serie_canonica(df[columna])
+        hashes = pd.util.hash_pandas_object(serie, index=False).to_numpy()
+        hashes = np.where(serie.isna().to_numpy(), np.uint64(0), hashes)
+        total = total * np.uint64(1_000_003) ^ hashes
+    return total
+
+
+def _marcar_repetidas(hashes, vistos):
+    """
+    Marca las filas cuyo hash ya apareció (en el bloque o en `vistos`, un
+    array ordenado) y devuelve (repetidas, vistos_actualizado).
+    """
+    repetidas = pd.Series(hashes).duplicated().to_numpy()
+    if len(vistos):
+        posiciones = np.minimum(np.searchsorted(vistos, hashes), len(vistos) - 1)
+        repetidas = repetidas | (vistos[posiciones] == hashes)
+    nuevos = np.sort(hashes[~repetidas])
+    return repetidas, np.insert(vistos, np.searchsorted(vistos, nuevos), nuevos)
+
+
+def _filtrar_bloques(bloques, estado, columnas_estadisticas=(), columnas_conteo=(),
+                     columnas_correlacion=(), error=None):
+    """
+    Generador: descarta los duplicados de cada bloque (hash de 64 bits por
+    fila sobre tipos canónicos, también entre bloques con distintos dtypes)
+    y entrega las filas que quedan.
+    En `estado` acumula filas, duplicados, nulos por columna y, sobre las
+    filas que sobreviven, conteos y moda (y media y mediana aproximada en
+    `columnas_estadisticas`, y co-momentos de `columnas_correlacion`).
+    """
+    estadisticas = {columna: EstadisticasColumna(numerica=True, error=error) for columna in columnas_estadisticas}
+    estadisticas.update({
+        columna: EstadisticasColumna(numerica=False)
+        for columna in columnas_conteo if columna not in estadisticas
+    })
+    estado.update(filas_originales=0, duplicados=0, nulos_por_columna=None, estadisticas=estadisticas,
+                  momentos=MomentosConjuntos(columnas_correlacion) if columnas_correlacion else None)
+    vistos = np.empty(0, dtype=np.uint64)
+
+    for bloque in bloques:
+        estado["filas_originales"] += len(bloque)
+        nulos = bloque.isnull().sum()
+        estado["nulos_por_columna"] = (
+            nulos if estado["nulos_por_columna"] is None
+            else estado["nulos_por_columna"].add(nulos, fill_value=0)
+        )
+
+        repetidas, vistos = _marcar_repetidas(_hash_filas_canonico(bloque), vistos)
+        estado["duplicados"] += int(repetidas.sum())
+
+        parte = bloque[~repetidas]
+        for columna, acumulador in estadisticas.items():
+            acumulador.agregar(parte[columna])
+        if estado["momentos"] is not None:
+            estado["momentos"].agregar(parte)
+        yield parte
+
+    if estado["nulos_por_columna"] is None:
+        raise ValueError("La hoja no contiene filas de datos.")
+    estado["nulos_por_columna"] = estado["nulos_por_columna"].astype(int)
+
+
+def consumir_bloques(bloques, columnas_estadisticas=(), columnas_conteo=(), error=None):
+    """
+    Recorre los bloques descartando duplicados y acumulando nulos y
+    estadísticas (ver _filtrar_bloques).
+    Devuelve (df_sin_duplicados, filas_originales, nulos_por_columna,
+    duplicados, estadisticas_por_columna).
+    """
+    estado = {}
+    partes = list(_filtrar_bloques(bloques, estado, columnas_estadisticas, columnas_conteo, error=error))
+
+    df = _concatenar_bloques(partes)
+    resumenes = {columna: acumulador.resumen() for columna, acumulador in estado["estadisticas"].items()}
+    return df, estado["filas_originales"], estado["nulos_por_columna"], estado["duplicados"], resumenes
+
+# ============================================================
+# PERFIL DE TABLAS (una sola pasada para las estadísticas)
+# ============================================================
+
+def _estadisticas_desde_conteos(conteos, numerica):
+    """Moda (y media/mediana si es numérica) a partir de un value_counts."""
+    conteos = conteos[conteos > 0]
+    if conteos.empty:
+        return {"moda": np.nan, "media": np.nan, "mediana": np.nan}
+
+    # Igual que Series.mode()[0]: ante empates, el menor valor
+    candidatos = pd.Series(conteos.index[conteos.to_numpy() == conteos.max()])
+    estadisticas = {"moda": candidatos.sort_values().iloc[0]}
+
+    if numerica:
+        ordenados = conteos.sort_index()
+        valores = ordenados.index.to_numpy()
+        frecuencias = ordenados.to_numpy()
+        n = int(frecuencias.sum())
+        acumulado = np.cumsum(frecuencias)
+
+        estadisticas["media"] = float(np.dot(valores, frecuencias)) / n
+        medio_bajo = valores[np.searchsorted(acumulado, (n - 1) // 2, side="right")]
+        medio_alto = valores[np.searchsorted(acumulado, n // 2, side="right")]
+        estadisticas["mediana"] = (float(medio_bajo) + float(medio_alto)) / 2
+    return estadisticas
+
+
+def perfilar_tabla(df, columnas_clave=None, columnas_estadisticas=(), columnas_conteo=(),
+                   detectar_duplicados=True, mascara_duplicados=None):
+    """
+    Perfil de una tabla calculado una sola vez:
+    - nulos por columna y totales (una única máscara isnull)
+    - duplicados de la fila completa con un hash de 64 bits por fila; si se
+      indican `columnas_clave`, la máscara para eliminar duplicados se arma
+      solo con esas columnas
+    - sobre las filas que sobreviven, UN value_counts por columna del que
+      salen conteos y moda (y media y mediana en `columnas_estadisticas`)
+    Si ya se tiene la máscara de duplicados de fila completa (índice
+    incremental) se pasa en `mascara_duplicados` y no se vuelve a hashear.
+    Devuelve un dict que leen los `resumen` y los gráficos.
+    """
+    nulos_por_columna = df.isnull().sum()
+
+    if mascara_duplicados is not None:
+        duplicadas = mascara_duplicados
+    elif detectar_duplicados and len(df):
+        duplicadas = pd.Series(pd.util.hash_pandas_object(df, index=False).to_numpy()).duplicated().to_numpy()
+        if columnas_clave is None or list(columnas_clave) == list(df.columns):
+            mascara_duplicados = duplicadas
+        else:
+            mascara_duplicados = pd.Series(
+                pd.util.hash_pandas_object(df[list(columnas_clave)], index=False).to_numpy()
+            ).duplicated().to_numpy()
+    else:
+        duplicadas = mascara_duplicados = np.zeros(len(df), dtype=bool)
+
+    hay_duplicados = bool(mascara_duplicados.any())
+    columnas = {}
+    for columna in list(columnas_estadisticas) + [c for c in columnas_conteo if c not in columnas_estadisticas]:
+        serie = df[columna][~mascara_duplicados] if hay_duplicados else df[columna]
+        conteos = serie.value_counts()
+        numerica = columna in columnas_estadisticas and pd.api.types.is_numeric_dtype(serie)
+        columnas[columna] = {"conteos": conteos, **_estadisticas_desde_conteos(conteos, numerica)}
+
+    return {
+        "filas": len(df),
+        "nulos_por_columna": nulos_por_columna,
+        "nulos_totales": int(nulos_por_columna.sum()),
+        "duplicados": int(duplicadas.sum()),
+        "mascara_duplicados": mascara_duplicados,
+        "columnas": columnas,
+    }
+
+# ============================================================
+# ESTADÍSTICAS EN STREAMING (por bloques y fusionables)
+# ============================================================
+
+# Error de rango de los cuantiles aproximados (0.005 = ±0,5 % de las filas)
+ERROR_CUANTILES = float(os.environ.get("AURELION_ERROR_CUANTILES", "0.005"))
+
+# Umbrales q1/q2 de Sprint 3 con el boceto en lugar del cuantil exacto
+UMBRALES_APROXIMADOS = os.environ.get("AURELION_UMBRALES_APROXIMADOS", "0") == "1"
+
+
+class BocetoCuantiles:
+    """
+    Boceto de cuantiles tipo KLL: una pila de compactadores donde cada
+    elemento del nivel h representa 2**h valores. Cuando un nivel se llena
+    se ordena y sube la mitad (posiciones pares o impares, al azar).
+    Usa memoria O(1/error) y, mientras no compacta, es exacto.
+    Se alimenta por bloques y dos bocetos se fusionan nivel a nivel.
+    """
+
+    def __init__(self, error=None, semilla=42):
+        self.error = ERROR_CUANTILES if error is None else error
+        self.k = max(8, int(np.ceil(2.0 / self.error)))
+        self.n = 0
+        self.niveles = [np.empty(0)]
+        self._rng = np.random.default_rng(semilla)
+
+    def _capacidad(self, nivel):
+        # Los niveles más pesados (arriba) guardan más: k * (2/3)^profundidad
+        profundidad = len(self.niveles) - nivel - 1
+        return max(2, int(np.ceil(self.k * (2 / 3) ** profundidad)))
+
+    def _compactar(self):
+        while sum(map(len, self.niveles)) > sum(self._capacidad(h) for h in range(len(self.niveles))):
+            h = next(h for h, items in enumerate(self.niveles) if len(items) >= self._capacidad(h))
+            if h + 1 == len(self.niveles):
+                self.niveles.append(np.empty(0))
+
+            items = np.sort(self.niveles[h])
+            # Con cantidad impar el último elemento se queda en su nivel
+            resto = items[len(items) - len(items) % 2:]
+            subidos = items[:len(items) - len(resto)][self._rng.integers(2)::2]
+            self.niveles[h] = resto
+            self.niveles[h + 1] = np.concatenate([self.niveles[h + 1], subidos])
+
+    def agregar(self, valores):
+        valores = np.asarray(valores, dtype=float)
+        valores = valores[~np.isnan(valores)]
+        self.n += len(valores)
+        self.niveles[0] = np.concatenate([self.niveles[0], valores])
+        self._compactar()
+        return self
+
+    def fusionar(self, otro):
+        while len(self.niveles) < len(otro.niveles):
+            self.niveles.append(np.empty(0))
+        for h, items in enumerate(otro.niveles):
+            self.niveles[h] = np.concatenate([self.niveles[h], items])
+        self.n += otro.n
+        self._compactar()
+        return self
+
+    def cuantil(self, q):
+        """Cuantil q (0-1) con error de rango ~ self.error; NaN si está vacío."""
+        if self.n == 0:
+            return np.nan
+        valores = np.concatenate(self.niveles)
+        pesos = np.concatenate([np.full(len(items), 2 ** h) for h, items in enumerate(self.niveles)])
+        orden = np.argsort(valores, kind="stable")
+        acumulado = np.cumsum(pesos[orden])
+        posicion = min(int(np.searchsorted(acumulado, q * acumulado[-1])), len(valores) - 1)
+        return float(valores[orden][posicion])
+
+
+class MediaIncremental:
+    """Media por bloques (suma y cantidad): exacta y fusionable."""
+
+    def __init__(self):
+        self.n = 0
+        self.suma = 0.0
+
+    def agregar(self, valores):
+        valores = pd.Series(valores).dropna()
+        self.n += len(valores)
+        self.suma += float(valores.sum())
+        return self
+
+    def fusionar(self, otra):
+        self.n += otra.n
+        self.suma += otra.suma
+        return self
+
+    @property
+    def media(self):
+        return self.suma / self.n if self.n else np.nan
+
+
+class ConteoModa:
+    """Conteos por valor acumulados por bloques; la moda sale como Series.mode()[0]."""
+
+    def __init__(self):
+        self.conteos = pd.Series(dtype="int64")
+
+    def agregar(self, valores):
+        return self.agregar_conteos(pd.Series(valores).value_counts())
+
+    def fusionar(self, otro):
+        return self.agregar_conteos(otro.conteos)
+
+    def agregar_conteos(self, conteos):
+        self.conteos = conteos if self.conteos.empty else self.conteos.add(conteos, fill_value=0)
+        return self
+
+    @property
+    def moda(self):
+        return _estadisticas_desde_conteos(self.conteos, numerica=False)["moda"]
+
+
+# Valores candidatos a moda que se siguen en las columnas numéricas fuera de memoria
+FRECUENTES_MODA = int(os.environ.get("AURELION_FRECUENTES_MODA", "1024"))
+
+
+class ConteoFrecuentes:
+    """
+    Resumen de Misra-Gries: a lo sumo `capacidad` valores reales con su
+    conteo. Si hay más, a todos se les resta el conteo del primero que no
+    entra; cada conteo queda subestimado en menos de n / (capacidad + 1), así
+    que todo valor más frecuente que eso sobrevive. Misma interfaz que
+    ConteoModa (la moda sale del mayor conteo) y exacto mientras los valores
+    distintos no superen la capacidad.
+    """
+
+    def __init__(self, capacidad=None):
+        self.capacidad = FRECUENTES_MODA if capacidad is None else capacidad
+        self.conteos = pd.Series(dtype="int64")
+
+    def agregar(self, valores):
+        return self.agregar_conteos(pd.Series(valores).value_counts())
+
+    def fusionar(self, otro):
+        return self.agregar_conteos(otro.conteos)
+
+    def agregar_conteos(self, conteos):
+        conteos = conteos if self.conteos.empty else self.conteos.add(conteos, fill_value=0)
+        if len(conteos) > self.capacidad:
+            conteos = conteos - conteos.nlargest(self.capacidad + 1).iloc[-1]
+            conteos = conteos[conteos > 0]
+        self.conteos = conteos
+        return self
+
+    @property
+    def moda(self):
+        return _estadisticas_desde_conteos(self.conteos, numerica=False)["moda"]
+
+
+# Cubetas del histograma de las columnas numéricas fuera de memoria
+CUBETAS_HISTOGRAMA = int(os.environ.get("AURELION_CUBETAS_HISTOGRAMA", "4096"))
+
+
+class HistogramaAcotado:
+    """
+    Conteos de una columna numérica en a lo sumo `cubetas` cubetas de igual
+    ancho, alineadas a múltiplos del ancho. El ancho arranca en 1 (enteros
+    con rango menor a `cubetas`: conteos exactos) y se duplica, fusionando
+    cubetas de a pares, cuando los valores no entran en el rango.
+    Misma interfaz que ConteoModa, pero con memoria constante; los conteos
+    se indexan por el centro de cada cubeta (con ancho 1, el valor mismo),
+    así que su moda es una cubeta: la moda real sale de ConteoFrecuentes.
+    """
+
+    def __init__(self, cubetas=None):
+        self.cubetas = CUBETAS_HISTOGRAMA if cubetas is None else cubetas
+        self.ancho = 1.0
+        self.inicio = None
+        self.cuentas = np.zeros(self.cubetas, dtype=np.int64)
+
+    def _reubicar(self, minimo, maximo, ancho_minimo=1.0):
+        ocupadas = np.flatnonzero(self.cuentas)
+        if len(ocupadas):
+            minimo = min(minimo, self.inicio + ocupadas[0] * self.ancho)
+            maximo = max(maximo, self.inicio + ocupadas[-1] * self.ancho)
+        ancho = max(self.ancho, ancho_minimo)
+        while maximo >= np.floor(minimo / ancho) * ancho + self.cubetas * ancho:
+            ancho *= 2
+        inicio = np.floor(minimo / ancho) * ancho
+        if len(ocupadas):
+            # Cada cubeta vieja cae entera dentro de una nueva
+            destino = ((self.inicio + ocupadas * self.ancho - inicio) // ancho).astype(np.int64)
+            cuentas = np.zeros(self.cubetas, dtype=np.int64)
+            np.add.at(cuentas, destino, self.cuentas[ocupadas])
+            self.cuentas = cuentas
+        self.ancho, self.inicio = ancho, inicio
+
+    def _agregar_ponderado(self, valores, pesos, ancho_minimo=1.0):
+        if not len(valores):
+            return self
+        minimo, maximo = float(valores.min()), float(valores.max())
+        if (self.inicio is None or minimo < self.inicio or ancho_minimo > self.ancho
+                or maximo >= self.inicio + self.cubetas * self.ancho):
+            self._reubicar(minimo, maximo, ancho_minimo)
+        posiciones = ((valores - self.inicio) // self.ancho).astype(np.int64)
+        self.cuentas += np.bincount(posiciones, weights=pesos, minlength=self.cubetas).astype(np.int64)
+        return self
+
+    def agregar(self, valores):
+        valores = pd.Series(valores).dropna().to_numpy(dtype=float)
+        return self._agregar_ponderado(valores, np.ones(len(valores)))
+
+    def fusionar(self, otro):
+        ocupadas = np.flatnonzero(otro.cuentas)
+        if not len(ocupadas):
+            return self
+        # Los bordes izquierdos de `otro` caen en la cubeta que los contiene
+        return self._agregar_ponderado(otro.inicio + ocupadas * otro.ancho, otro.cuentas[ocupadas], otro.ancho)
+
+    @property
+    def conteos(self):
+        ocupadas = np.flatnonzero(self.cuentas)
+        centros = self.inicio + ocupadas * self.ancho + (self.ancho - 1) / 2 if len(ocupadas) else []
+        return pd.Series(self.cuentas[ocupadas], index=pd.Index(centros, dtype=float))
+
+    @property
+    def moda(self):
+        return _estadisticas_desde_conteos(self.conteos, numerica=False)["moda"]
+
+
+class EstadisticasColumna:
+    """
+    Conteos y moda de una columna y, si es numérica, media y mediana
+    aproximada; mismo formato que perfilar_tabla()["columnas"][columna].
+    En las numéricas los conteos salen de un HistogramaAcotado (memoria
+    constante; exactos mientras el rango sea menor que CUBETAS_HISTOGRAMA)
+    y la moda, un valor real de la columna, de un ConteoFrecuentes.
+    """
+
+    def __init__(self, numerica=True, error=None):
+        self.conteo = HistogramaAcotado() if numerica else ConteoModa()
+        self.frecuentes = ConteoFrecuentes() if numerica else self.conteo
+        self.media = MediaIncremental() if numerica else None
+        self.boceto = BocetoCuantiles(error) if numerica else None
+
+    def agregar(self, serie):
+        self.conteo.agregar(serie)
+        if self.media is not None and pd.api.types.is_numeric_dtype(serie):
+            self.frecuentes.agregar(serie)
+            self.media.agregar(serie)
+            self.boceto.agregar(serie.to_numpy(dtype=float, na_value=np.nan))
+        return self
+
+    def fusionar(self, otra):
+        self.conteo.fusionar(otra.conteo)
+        if self.media is not None:
+            self.frecuentes.fusionar(otra.frecuentes)
+            self.media.fusionar(otra.media)
+            self.boceto.fusionar(otra.boceto)
+        return self
+
+    def resumen(self):
+        conteos = self.conteo.conteos
+        conteos = conteos[conteos > 0].astype(int).sort_values(ascending=False, kind="stable")
+        estadisticas = {"conteos": conteos, "moda": self.frecuentes.moda, "media": np.nan, "mediana": np.nan}
+        if self.media is not None and self.media.n:
+            estadisticas.update(media=self.media.media, mediana=self.boceto.cuantil(0.5))
+        return estadisticas
+
+class MomentosConjuntos:
+    """
+    Medias y co-momentos de varias columnas acumulados por bloques
+    (fusión de Chan): la correlación sin tener la tabla completa.
+    """
+
+    def __init__(self, columnas):
+        self.columnas = list(columnas)
+        self.n = 0
+        self.medias = np.zeros(len(self.columnas))
+        self.comomentos = np.zeros((len(self.columnas), len(self.columnas)))
+
+    def agregar(self, df):
+        valores = df[self.columnas].dropna().to_numpy(dtype=float)
+        if not len(valores):
+            return self
+        bloque = MomentosConjuntos(self.columnas)
+        bloque.n = len(valores)
+        bloque.medias = valores.mean(axis=0)
+        centrados = valores - bloque.medias
+        bloque.comomentos = centrados.T @ centrados
+        return self.fusionar(bloque)
+
+    def fusionar(self, otro):
+        if otro.n == 0:
+            return self
+        n = self.n + otro.n
+        delta = otro.medias - self.medias
+        self.comomentos = self.comomentos + otro.comomentos + np.outer(delta, delta) * self.n * otro.n / n
+        self.medias = self.medias + delta * otro.n / n
+        self.n = n
+        return self
+
+    def correlacion(self):
+        desvios = np.sqrt(np.diag(self.comomentos))
+        return pd.DataFrame(self.comomentos / np.outer(desvios, desvios),
+                            index=self.columnas, columns=self.columnas)
+
+# ============================================================
+# ÍNDICE PERSISTENTE DE DUPLICADOS (solo se hashean filas nuevas)
+# ============================================================
+
+def _firma_columnas(df):
+    return "|".join(
+        f"{col}:{'category' if isinstance(df[col].dtype, pd.CategoricalDtype) else df[col].dtype}"
+        for col in df.columns
+    )
+
+
+def _hash_filas(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def _resumen_hashes(hashes):
+    return hashlib.sha256(np.ascontiguousarray(hashes, dtype=np.uint64).tobytes()).hexdigest()
+
+
+def deduplicar_incremental(df, tabla):
+    """
+    Detecta duplicados de fila completa usando un índice guardado en
+    CARPETA_CACHE/indices/<tabla>.npz con los hashes de 64 bits de las filas
+    ya vistas y las posiciones de los duplicados de corridas anteriores.
+    Todas las filas se hashean en cada corrida (una pasada vectorizada) y el
+    prefijo ya indexado se verifica completo contra el resumen SHA-256 de
+    sus hashes en orden: si coincide, solo se buscan duplicados entre las
+    filas agregadas; si alguna fila anterior cambió, el índice se reconstruye.
+    Devuelve (mascara_duplicados, duplicados_nuevos).
+    """
+    ruta = CARPETA_CACHE / "indices" / f"{tabla}.npz"
+    firma = _firma_columnas(df)
+    hashes_filas = _hash_filas(df)
+
+    hashes = np.empty(0, dtype=np.uint64)
+    duplicadas_previas = np.empty(0, dtype=np.int64)
+    filas_previas = 0
+
+    if ruta.exists():
+        try:
+            with np.load(ruta) as indice:
+                filas = int(indice["filas"])
+                if (str(indice["firma"]) == firma and filas <= len(df)
+                        and str(indice["resumen"]) == _resumen_hashes(hashes_filas[:filas])):
+                    hashes = indice["hashes"]
+                    duplicadas_previas = indice["duplicadas"]
+                    filas_previas = filas
+        except (OSError, ValueError, KeyError):
+            pass  # índice ilegible: se reconstruye
+
+    hashes_nuevos = hashes_filas[filas_previas:]
+    repetidas = pd.Series(hashes_nuevos).duplicated().to_numpy()
+    if len(hashes):
+        posiciones = np.searchsorted(hashes, hashes_nuevos).clip(max=len(hashes) - 1)
+        repetidas = repetidas | (hashes[posiciones] == hashes_nuevos)
+
+    mascara = np.zeros(len(df), dtype=bool)
+    mascara[duplicadas_previas] = True
+    mascara[filas_previas:] = repetidas
+
+    if filas_previas and filas_previas == len(df):
+        return mascara, 0  # sin filas nuevas: el índice guardado sigue vigente
+
+    # Las filas nuevas no repetidas son hashes distintos: se insertan ordenados
+    agregados = np.sort(hashes_nuevos[~repetidas])
+    hashes = np.insert(hashes, np.searchsorted(hashes, agregados), agregados)
+
+    ruta.parent.mkdir(parents=True, exist_ok=True)
+    ruta_tmp = ruta.with_suffix(".tmp.npz")
+    np.savez(
+        ruta_tmp,
+        firma=np.array(firma),
+        filas=np.array(len(df)),
+        hashes=hashes,
+        duplicadas=np.flatnonzero(mascara),
+        resumen=np.array(_resumen_hashes(hashes_filas)),
+    )
+    os.replace(ruta_tmp, ruta)
+
+    return mascara, int(repetidas.sum())
+
+# ============================================================
+# PIPELINE DE LIMPIEZA (sin prints ni gráficos)
+# ============================================================
+# Cada etapa recibe la tabla original y devuelve (df_limpio, resumen).
+# No imprime, no grafica ni escribe a disco: el menú y la exportación solo
+# consumen el resultado (el índice de duplicados lo actualiza el menú).
+# El `resumen` incluye además el perfil de la tabla y las columnas
+# eliminadas para quien quiera mostrarlos.
+
+def _quitar_columnas(df, columnas_redundantes):
+    """Devuelve (df_sin_columnas, columnas_eliminadas)."""
+    columnas_existentes = [col for col in columnas_redundantes if col in df.columns]
     if columnas_existentes:
-        df_cliente = df_cliente.drop(columns=columnas_existentes)
-        print(f"Columnas eliminadas: {columnas_existentes}\n")
+        df = df.drop(columns=columnas_existentes)
+    return df, columnas_existentes
+
+
+def _quitar_duplicados(df, perfil):
+    if perfil["mascara_duplicados"].any():
+        return df[~perfil["mascara_duplicados"]]
+    return df
+
+
+def _resumen_limpieza(perfil, df_limpio, columnas_eliminadas):
+    return {
+        "filas_originales": perfil["filas"],
+        "filas_finales": len(df_limpio),
+        "duplicados_eliminados": perfil["duplicados"],
+        "nulos_detectados": perfil["nulos_totales"],
+        "columnas_eliminadas": columnas_eliminadas,
+        "perfil": perfil,
+    }
+
+
+def _perfilar_historial(datos, indice_duplicados, **columnas):
+    """
+    Perfil de Ventas / Detalle_Ventas, que pueden llegar como DataFrame o
+    como bloques de leer_hoja_por_bloques(). `indice_duplicados` es el
+    resultado de deduplicar_incremental() (solo para DataFrames) o None.
+    Devuelve (df, perfil, duplicados_nuevos).
+    """
+    if not isinstance(datos, pd.DataFrame):
+        # Los bloques llegan sin duplicados; como la tabla igual se concatena
+        # en memoria, las estadísticas se calculan exactas sobre ella (el
+        # boceto de cuantiles queda para limpiar_fuera_de_memoria)
+        df, filas, nulos_por_columna, duplicados, _ = consumir_bloques(datos)
+        perfil = perfilar_tabla(df, detectar_duplicados=False, **columnas)
+        perfil.update(filas=filas, nulos_por_columna=nulos_por_columna,
+                      nulos_totales=int(nulos_por_columna.sum()), duplicados=duplicados)
+        return df, perfil, None
+
+    mascara, duplicados_nuevos = indice_duplicados if indice_duplicados is not None else (None, None)
+    return datos, perfilar_tabla(datos, mascara_duplicados=mascara, **columnas), duplicados_nuevos
+
+
+def construir_clasificador_categorias(df_map):
+    """
+    Compila UNA vez el mapeo de palabras clave en una sola expresión regular:
+        ^(?:(?=.*?palabra_1)()|(?=.*?palabra_2)()|...)
+    Las alternativas se prueban en orden de `prioridad`, así gana la primera
+    palabra clave contenida en el nombre (igual que recorrer df_map fila por
+    fila); si ninguna aparece, "Otros".
+    Devuelve una función que clasifica una Serie completa de nombres.
+    """
+    df_map = df_map.dropna(subset=["palabra_clave"])
+    df_map = df_map.assign(palabra_clave=df_map["palabra_clave"].astype(str).str.lower().str.strip())
+    df_map = df_map.sort_values(by="prioridad")
+
+    categorias = df_map["categoria_general"].tolist()
+    patron = re.compile(
+        "^(?:" + "|".join(f"(?=.*?{re.escape(palabra)})()" for palabra in df_map["palabra_clave"]) + ")",
+        re.DOTALL
+    )
+
+    def categoria_de(nombre):
+        coincidencia = patron.match(str(nombre).lower())
+        if coincidencia is None or coincidencia.lastindex is None:
+            return "Otros"
+        return categorias[coincidencia.lastindex - 1]
+
+    def clasificar(nombres):
+        nombres = nombres.astype(object)
+        # Cada nombre distinto se evalúa una sola vez
+        tabla = {nombre: categoria_de(nombre) for nombre in pd.unique(nombres.dropna())}
+        return nombres.map(tabla).fillna("Otros")
+
+    return clasificar
+
+
+def limpiar_clientes(df_cliente):
+    """Clientes: quita columnas de contacto y duplicados."""
+    columnas_redundantes = ['email', 'telefono']
+    perfil = perfilar_tabla(
+        df_cliente,
+        columnas_clave=[col for col in df_cliente.columns if col not in columnas_redundantes],
+        columnas_conteo=['ciudad']
+    )
+    df, columnas_eliminadas = _quitar_columnas(df_cliente, columnas_redundantes)
+    df = _quitar_duplicados(df, perfil)
+
+    resumen = _resumen_limpieza(perfil, df, columnas_eliminadas)
+    resumen["moda_ciudad"] = perfil["columnas"]["ciudad"]["moda"]
+    return df, resumen
+
+
+def limpiar_productos(df_producto, df_map):
+    """Productos: quita duplicados, completa stock y reclasifica la categoría."""
+    columnas_redundantes = ['categoria']
+    perfil = perfilar_tabla(
+        df_producto,
+        columnas_clave=[col for col in df_producto.columns if col not in columnas_redundantes],
+        columnas_estadisticas=['precio_unitario']
+    )
+    df, columnas_eliminadas = _quitar_columnas(df_producto, columnas_redundantes)
+    df = _quitar_duplicados(df, perfil)
+
+    # assign() en lugar de asignar columnas: las tablas del contexto son compartidas
+    if "stock_actual" not in df.columns:
+        np.random.seed(42)
+        df = df.assign(stock_actual=np.random.randint(10, 31, size=len(df)))
+
+    clasificar = construir_clasificador_categorias(df_map)
+    df = df.assign(categoria_general=clasificar(df['nombre_producto']))
+    df = df[['id_producto', 'nombre_producto', 'categoria_general', 'precio_unitario', 'stock_actual']]
+
+    estadisticas_precio = perfil["columnas"]["precio_unitario"]
+    resumen = _resumen_limpieza(perfil, df, columnas_eliminadas)
+    resumen.update(
+        media_precio=estadisticas_precio["media"],
+        mediana_precio=estadisticas_precio["mediana"],
+        moda_precio=estadisticas_precio["moda"]
+    )
+    return df, resumen
+
+
+def limpiar_ventas(df_ventas, indice_duplicados=None):
+    """Ventas (DataFrame o bloques): quita duplicados y datos personales."""
+    df, perfil, duplicados_nuevos = _perfilar_historial(
+        df_ventas, indice_duplicados, columnas_conteo=['medio_pago']
+    )
+    df = _quitar_duplicados(df, perfil)
+    df, columnas_eliminadas = _quitar_columnas(df, ['nombre_cliente', 'email'])
+
+    resumen = _resumen_limpieza(perfil, df, columnas_eliminadas)
+    resumen.update(
+        moda_medio_pago=perfil["columnas"]["medio_pago"]["moda"],
+        duplicados_nuevos=duplicados_nuevos
+    )
+    return df, resumen
+
+
+def limpiar_detalle(df_detalle, indice_duplicados=None):
+    """Detalle_Ventas (DataFrame o bloques): quita duplicados y columnas repetidas de Productos."""
+    df, perfil, duplicados_nuevos = _perfilar_historial(
+        df_detalle, indice_duplicados, columnas_estadisticas=['importe']
+    )
+    df = _quitar_duplicados(df, perfil)
+    df, columnas_eliminadas = _quitar_columnas(df, ['nombre_producto', 'precio_unitario'])
+
+    estadisticas_importe = perfil["columnas"]["importe"]
+    resumen = _resumen_limpieza(perfil, df, columnas_eliminadas)
+    resumen.update(
+        media_importe=estadisticas_importe["media"],
+        mediana_importe=estadisticas_importe["mediana"],
+        moda_importe=estadisticas_importe["moda"],
+        duplicados_nuevos=duplicados_nuevos,
+        correlacion=df[["cantidad", "importe"]].corr()
+    )
+    return df, resumen
+
+
+# Último resultado de limpieza por hoja: {hoja: {clave: (df_limpio, resumen)}}
+_cache_limpieza = {}
+
+
+def huella_tabla(df):
+    """Hash del contenido de un DataFrame (columnas, dtypes, índice y valores)."""
+    h = hashlib.sha256()
+    h.update(repr([(str(col), str(tipo)) for col, tipo in df.dtypes.items()]).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def limpiar_tabla(hoja, datos, df_map=None, indice_duplicados=None):
+    """
+    Corre la etapa de `hoja` reutilizando el resultado si la misma tabla
+    (por contenido) ya se limpió con los mismos parámetros.
+    La limpieza es idempotente, así que la tabla ya limpia también se
+    registra como entrada: exportar lo limpiado desde el menú no recalcula.
+    Los bloques (entrada no DataFrame) no se cachean.
+    `indice_duplicados` (Ventas / Detalle_Ventas) es el resultado de
+    deduplicar_incremental(), calculado por quien llama.
+    """
+    etapa = {
+        "Clientes": limpiar_clientes,
+        "Productos": lambda df: limpiar_productos(df, df_map),
+        "Ventas": lambda df: limpiar_ventas(df, indice_duplicados),
+        "Detalle_Ventas": lambda df: limpiar_detalle(df, indice_duplicados),
+    }[hoja]
+    parametros = huella_tabla(df_map) if hoja == "Productos" else None
+
+    if not isinstance(datos, pd.DataFrame):
+        return etapa(datos)
+
+    # Los duplicados nuevos solo cambian el resumen, no la tabla limpia
+    duplicados_nuevos = None if indice_duplicados is None else indice_duplicados[1]
+    cache_hoja = _cache_limpieza.get(hoja, {})
+    clave = (huella_tabla(datos), parametros, duplicados_nuevos)
+    if clave in cache_hoja:
+        return cache_hoja[clave]
+
+    resultado = etapa(datos)
+    _cache_limpieza[hoja] = {
+        clave: resultado,
+        (huella_tabla(resultado[0]), parametros, None): resultado
+    }
+    return resultado
+
+
+# ============================================================
+# LIMPIEZA FUERA DE MEMORIA (Ventas / Detalle_Ventas)
+# ============================================================
+# La hoja se recorre por bloques acotados: cada bloque se deduplica (hash
+# por fila contra un array ordenado de hashes ya vistos, 8 bytes por fila),
+# se le quitan las columnas redundantes, suma a los resúmenes en streaming
+# y se escribe a disco. En RAM solo vive un bloque a la vez.
+# El presupuesto de memoria dimensiona el bloque. Quedan fuera de él el
+# array de hashes (8 bytes por fila distinta, ~80 MB cada 10 M de filas) y
+# los conteos de las columnas de texto (uno por valor distinto); las
+# numéricas usan un HistogramaAcotado y un BocetoCuantiles de tamaño fijo.
+
+LIMPIEZA_FUERA_DE_MEMORIA = os.environ.get("AURELION_FUERA_DE_MEMORIA", "0") == "1"
+
+# Memoria que puede usar un bloque (MB); de acá sale el tamaño del bloque
+PRESUPUESTO_MEMORIA_MB = int(os.environ.get("AURELION_PRESUPUESTO_MB", "256"))
+
+# Un bloque ocupa unas 10 veces su tamaño tipado mientras openpyxl lo
+# entrega como tuplas de objetos Python
+FACTOR_MEMORIA_BLOQUE = 10
+
+HOJAS_FUERA_DE_MEMORIA = {
+    "Ventas": {
+        "columnas_redundantes": ["nombre_cliente", "email"],
+        "columnas_conteo": ["medio_pago"],
+    },
+    "Detalle_Ventas": {
+        "columnas_redundantes": ["nombre_producto", "precio_unitario"],
+        "columnas_estadisticas": ["importe"],
+        "columnas_correlacion": ["cantidad", "importe"],
+    },
+}
+
+
+def tamano_bloque_para_presupuesto(hoja, presupuesto_mb=None, ruta=None, muestra=None):
+    """
+    Filas por bloque para que cada bloque entre en el presupuesto de memoria.
+    El peso por fila se mide en `muestra` o en las primeras filas de la hoja.
+    """
+    presupuesto_mb = PRESUPUESTO_MEMORIA_MB if presupuesto_mb is None else presupuesto_mb
+    if muestra is None:
+        muestra = next(leer_hoja_por_bloques(hoja, 1_000, ruta), None)
+    if muestra is None or muestra.empty:
+        return TAMANO_BLOQUE
+    muestra = muestra.head(1_000)
+    bytes_por_fila = muestra.memory_usage(deep=True).sum() / len(muestra)
+    return max(1_000, int(presupuesto_mb * 1024 ** 2 / (bytes_por_fila * FACTOR_MEMORIA_BLOQUE)))
+
+
+def _carpeta_fuera_de_memoria(hoja):
+    carpeta = Path(os.path.splitext(RUTA_SALIDA)[0] + "_fuera_de_memoria") / hoja
+    shutil.rmtree(carpeta, ignore_errors=True)
+    carpeta.mkdir(parents=True, exist_ok=True)
+    return carpeta
+
+
+def leer_tabla_fuera_de_memoria(carpeta):
+    """Recorre por partes una tabla escrita por limpiar_fuera_de_memoria()."""
+    carpeta = Path(carpeta)
+    partes = sorted(carpeta.glob("parte-*.parquet"))
+    if partes:
+        for parte in partes:
+            yield pd.read_parquet(parte)
+    else:
+        yield from pd.read_csv(carpeta / f"{carpeta.name}.csv", chunksize=TAMANO_BLOQUE)
+
+
+def limpiar_fuera_de_memoria(hoja, datos=None, presupuesto_mb=None, ruta=None):
+    """
+    Limpia Ventas o Detalle_Ventas bloque a bloque y escribe la tabla limpia
+    en disco (Parquet por partes o, sin pyarrow, un CSV), sin prints.
+    `datos` puede ser None (se lee el libro por bloques), un DataFrame (se
+    recorre en porciones) o bloques ya armados.
+    Devuelve (carpeta_salida, resumen); el resumen tiene las mismas claves
+    que limpiar_ventas / limpiar_detalle más una `muestra` de la tabla limpia.
+    """
+    configuracion = HOJAS_FUERA_DE_MEMORIA[hoja]
+    if datos is None:
+        tamano = tamano_bloque_para_presupuesto(hoja, presupuesto_mb, ruta)
+        datos = leer_hoja_por_bloques(hoja, tamano, ruta)
+    elif isinstance(datos, pd.DataFrame):
+        df_completo = datos
+        tamano = tamano_bloque_para_presupuesto(hoja, presupuesto_mb, muestra=df_completo)
+        datos = (df_completo.iloc[inicio:inicio + tamano] for inicio in range(0, len(df_completo), tamano))
+
+    carpeta = _carpeta_fuera_de_memoria(hoja)
+    estado = {}
+    filas_finales = 0
+    muestra = None
+    columnas_eliminadas = []
+    bloques = _filtrar_bloques(
+        datos, estado,
+        columnas_estadisticas=configuracion.get("columnas_estadisticas", ()),
+        columnas_conteo=configuracion.get("columnas_conteo", ()),
+        columnas_correlacion=configuracion.get("columnas_correlacion", ())
+    )
+    for numero, parte in enumerate(bloques):
+        parte, columnas_eliminadas = _quitar_columnas(parte, configuracion["columnas_redundantes"])
+        if PARQUET_DISPONIBLE:
+            parte.to_parquet(carpeta / f"parte-{numero:05d}.parquet", index=False)
+        else:
+            parte.to_csv(carpeta / f"{hoja}.csv", mode="a", header=numero == 0, index=False)
+        filas_finales += len(parte)
+        if muestra is None:
+            muestra = parte.head()
+
+    estadisticas = {columna: acumulador.resumen() for columna, acumulador in estado["estadisticas"].items()}
+    perfil = {
+        "filas": estado["filas_originales"],
+        "nulos_por_columna": estado["nulos_por_columna"],
+        "nulos_totales": int(estado["nulos_por_columna"].sum()),
+        "duplicados": estado["duplicados"],
+        "mascara_duplicados": None,
+        "columnas": estadisticas,
+    }
+    resumen = {
+        "filas_originales": perfil["filas"],
+        "filas_finales": filas_finales,
+        "duplicados_eliminados": perfil["duplicados"],
+        "nulos_detectados": perfil["nulos_totales"],
+        "columnas_eliminadas": columnas_eliminadas,
+        "perfil": perfil,
+        "duplicados_nuevos": None,
+        "ruta_salida": str(carpeta),
+        "muestra": muestra,
+    }
+    if hoja == "Ventas":
+        resumen["moda_medio_pago"] = estadisticas["medio_pago"]["moda"]
+    else:
+        resumen.update(
+            media_importe=estadisticas["importe"]["media"],
+            mediana_importe=estadisticas["importe"]["mediana"],
+            moda_importe=estadisticas["importe"]["moda"],
+            correlacion=estado["momentos"].correlacion()
+        )
+    return str(carpeta), resumen
+
+
+# ============================================================
+# FUNCIONES DE LIMPIEZA + ANÁLISIS (DEMO 2)
+# ============================================================
+
+def _indice_duplicados(hoja, datos):
+    """Actualiza el índice de duplicados en disco y devuelve su resultado (o None)."""
+    if DEDUPLICACION_INCREMENTAL and isinstance(datos, pd.DataFrame):
+        return deduplicar_incremental(datos, hoja)
+    return None
+
+
+def _informar_columnas_eliminadas(columnas_eliminadas):
+    if columnas_eliminadas:
+        print(f"Columnas eliminadas: {columnas_eliminadas}\n")
     else:
         print("No había columnas redundantes para eliminar.\n")
 
+
+def limpiar_analizar_clientes(df_cliente, mostrar_graficos=True):
+    df_cliente, resumen = limpiar_tabla("Clientes", df_cliente)
+    perfil = resumen["perfil"]
+
+    print("Registros nulos por columna en Clientes:")
+    print(perfil["nulos_por_columna"])
+    _informar_columnas_eliminadas(resumen["columnas_eliminadas"])
+
     print("Tabla limpia de Clientes después de la limpieza:")
     print(df_cliente.head())
     print("DATASET BD AURELION")
     print("\n========= CLIENTES ===============")
 
-    duplicados = df_cliente.duplicated().sum()
-    if duplicados > 0:
-        df_cliente = df_cliente.drop_duplicates()
+    if perfil["mascara_duplicados"].any():
         print("Duplicados eliminados.\n")
 
-    moda_ciudad = df_cliente['ciudad'].mode()[0]
+    moda_ciudad = resumen["moda_ciudad"]
     print(f"La ciudad más frecuente es: {moda_ciudad}")
     print("====================================\n")
 
-    filas_finales = len(df_cliente)
-    resumen = {
-        "filas_originales": filas_originales,
-        "filas_finales": filas_finales,
-        "duplicados_eliminados": duplicados_iniciales,
-        "nulos_detectados": nulos_totales
-    }
-
     if mostrar_graficos:
-        conteo_ciudades = df_cliente['ciudad'].value_counts().reset_index()
+        conteo_ciudades = perfil["columnas"]["ciudad"]["conteos"].reset_index()
         conteo_ciudades.columns = ['ciudad', 'cantidad']
+        # Sin categorías vacías y con etiquetas de texto, en el orden de los conteos
+        conteo_ciudades = conteo_ciudades[conteo_ciudades['cantidad'] > 0].astype({'ciudad': str})
         colores = ['#4C72B0', '#55A868', '#C44E52', '#8172B3', '#CCB974', '#64B5CD']
 
         plt.figure(figsize=(4.5, 4.5))
@@ -153,71 +1681,28 @@ def limpiar_analizar_clientes(df_cliente, mostrar_graficos=True):
 
 
 def limpiar_analizar_productos(df_producto, df_map, mostrar_graficos=True):
-    filas_originales = len(df_producto)
-    nulos_totales = df_producto.isnull().sum().sum()
-    duplicados_iniciales = df_producto.duplicated().sum()
+    df_producto, resumen = limpiar_tabla("Productos", df_producto, df_map)
+    perfil = resumen["perfil"]
 
     print("Registros nulos por columna en Productos:")
-    print(df_producto.isnull().sum())
+    print(perfil["nulos_por_columna"])
+    _informar_columnas_eliminadas(resumen["columnas_eliminadas"])
 
-    columnas_redundantes = ['categoria']
-    columnas_existentes = [col for col in columnas_redundantes if col in df_producto.columns]
-    if columnas_existentes:
-        df_producto = df_producto.drop(columns=columnas_existentes)
-        print(f"Columnas eliminadas: {columnas_existentes}\n")
-    else:
-        print("No había columnas redundantes para eliminar.\n")
-
-    duplicados = df_producto.duplicated().sum()
-    if duplicados > 0:
-        df_producto = df_producto.drop_duplicates()
+    if perfil["mascara_duplicados"].any():
         print("Duplicados eliminados.\n")
 
-    if "stock_actual" not in df_producto.columns:
-        np.random.seed(42)
-        df_producto["stock_actual"] = np.random.randint(10, 31, size=len(df_producto))
-
-    media_producto = df_producto['precio_unitario'].mean()
-    mediana_producto = df_producto['precio_unitario'].median()
-    moda_producto = df_producto['precio_unitario'].mode()[0]
+    media_producto = resumen["media_precio"]
+    mediana_producto = resumen["mediana_precio"]
+    moda_producto = resumen["moda_precio"]
     print(f"El precio promedio es: {media_producto}")
     print(f"El precio central: {mediana_producto}")
     print(f"El precio más frecuente es: {moda_producto}\n")
 
-    df_map['palabra_clave'] = df_map['palabra_clave'].str.lower().str.strip()
-    df_map = df_map.sort_values(by="prioridad")
-
-    def clasificar_producto(nombre_producto):
-        if pd.isna(nombre_producto):
-            return "Otros"
-        nombre = str(nombre_producto).lower()
-        for _, fila in df_map.iterrows():
-            palabra = fila['palabra_clave']
-            categoria = fila['categoria_general']
-            if palabra in nombre:
-                return categoria
-        return "Otros"
-
-    df_producto['categoria_general'] = df_producto['nombre_producto'].apply(clasificar_producto)
-
-    df_producto = df_producto[['id_producto', 'nombre_producto', 'categoria_general', 'precio_unitario', 'stock_actual']]
-
     print("=============================================================")
     print("DataFrame limpio actualizado en memoria (Productos):")
     print(df_producto.head())
     print("-------------------------------------------------------------")
 
-    filas_finales = len(df_producto)
-    resumen = {
-        "filas_originales": filas_originales,
-        "filas_finales": filas_finales,
-        "duplicados_eliminados": duplicados_iniciales,
-        "nulos_detectados": nulos_totales,
-        "media_precio": media_producto,
-        "mediana_precio": mediana_producto,
-        "moda_precio": moda_producto
-    }
-
     if mostrar_graficos:
         plt.figure(figsize=(6.5, 3.5))
         colores = ['#4C72B0', '#55A868', '#C44E52', '#8172B3', '#CCB974', '#64B5CD']
@@ -263,54 +1748,55 @@ def limpiar_analizar_productos(df_producto, df_map, mostrar_graficos=True):
     return df_producto, resumen
 
 
-def limpiar_analizar_ventas(df_ventas, mostrar_graficos=True):
-    filas_originales = len(df_ventas)
-    nulos_totales = df_ventas.isnull().sum().sum()
-    duplicados_iniciales = df_ventas.duplicated().sum()
+def limpiar_analizar_ventas(df_ventas, mostrar_graficos=True, fuera_de_memoria=False):
+    # Acepta un DataFrame o los bloques de leer_hoja_por_bloques("Ventas").
+    # Con fuera_de_memoria=True (df_ventas puede ser None: se lee el libro por
+    # bloques) la tabla limpia queda en disco y se devuelve la ruta de su
+    # carpeta en lugar del DataFrame (exportar_bd_limpia() la acepta).
+    if fuera_de_memoria:
+        df_ventas, resumen = limpiar_fuera_de_memoria("Ventas", df_ventas)
+    else:
+        df_ventas, resumen = limpiar_tabla(
+            "Ventas", df_ventas, indice_duplicados=_indice_duplicados("Ventas", df_ventas)
+        )
+    perfil = resumen["perfil"]
 
     print("Registros nulos por columna en ventas:")
-    print(df_ventas.isnull().sum())
+    print(perfil["nulos_por_columna"])
     print("\n================================= VENTAS ===================================")
 
-    duplicados = df_ventas.duplicated().sum()
-    if duplicados > 0:
-        df_ventas = df_ventas.drop_duplicates()
+    if resumen["duplicados_eliminados"]:
         print("Duplicados eliminados.\n")
+    if resumen["duplicados_nuevos"] is not None:
+        print(f"Duplicados nuevos desde la última limpieza: {resumen['duplicados_nuevos']}\n")
 
-    moda_ventas = df_ventas['medio_pago'].mode()[0]
+    moda_ventas = resumen["moda_medio_pago"]
     print(f"El medio de pago más utilizado es: {moda_ventas}\n")
+    _informar_columnas_eliminadas(resumen["columnas_eliminadas"])
 
-    columnas_redundantes = ['nombre_cliente', 'email']
-    columnas_existentes = [col for col in columnas_redundantes if col in df_ventas.columns]
-    if columnas_existentes:
-        df_ventas = df_ventas.drop(columns=columnas_existentes)
-        print(f"Columnas eliminadas: {columnas_existentes}\n")
+    if fuera_de_memoria:
+        print(f"Tabla limpia (Ventas) guardada por bloques en: {df_ventas}")
+        print(resumen["muestra"])
     else:
-        print("No había columnas redundantes para eliminar.\n")
-
-    print("DataFrame limpio actualizado en memoria (Ventas):")
-    print(df_ventas.head())
+        print("DataFrame limpio actualizado en memoria (Ventas):")
+        print(df_ventas.head())
     print("============================================================================")
 
-    filas_finales = len(df_ventas)
-    resumen = {
-        "filas_originales": filas_originales,
-        "filas_finales": filas_finales,
-        "duplicados_eliminados": duplicados_iniciales,
-        "nulos_detectados": nulos_totales,
-        "moda_medio_pago": moda_ventas
-    }
-
     if mostrar_graficos:
-        conteo_medios_pago = df_ventas['medio_pago'].value_counts()
+        # Etiquetas como texto: con un índice categórico seaborn ordenaría
+        # las barras por categoría y no por conteo, como la línea de abajo
+        conteo_medios_pago = perfil["columnas"]["medio_pago"]["conteos"]
+        conteo_medios_pago = conteo_medios_pago[conteo_medios_pago > 0]
+        etiquetas_medios = conteo_medios_pago.index.astype(str)
 
         plt.figure(figsize=(7.5, 4.2))
         colores = ['#4C72B0', '#55A868', '#C44E52', '#8172B3', '#CCB974', '#64B5CD']
 
         sns.barplot(
-            x=conteo_medios_pago.index,
+            x=etiquetas_medios,
             y=conteo_medios_pago.values,
-            palette=colores,
+            order=list(etiquetas_medios),
+            palette=colores[:len(etiquetas_medios)],
             edgecolor='white',
             width=0.5
         )
@@ -349,170 +1835,870 @@ def limpiar_analizar_ventas(df_ventas, mostrar_graficos=True):
             color='black'
         )
 
-        plt.tight_layout()
-        plt.show()
+        plt.tight_layout()
+        plt.show()
+
+    return df_ventas, resumen
+
+
+def limpiar_analizar_detalle(df_detalle, mostrar_graficos=True, fuera_de_memoria=False):
+    # Acepta un DataFrame o los bloques de leer_hoja_por_bloques("Detalle_Ventas");
+    # fuera_de_memoria=True funciona igual que en limpiar_analizar_ventas()
+    if fuera_de_memoria:
+        df_detalle, resumen = limpiar_fuera_de_memoria("Detalle_Ventas", df_detalle)
+    else:
+        df_detalle, resumen = limpiar_tabla(
+            "Detalle_Ventas", df_detalle, indice_duplicados=_indice_duplicados("Detalle_Ventas", df_detalle)
+        )
+    perfil = resumen["perfil"]
+
+    print("\n==================== DETALLE DE VENTAS ============================")
+    print("Registros nulos por columna en Detalle_Ventas:")
+    print(perfil["nulos_por_columna"])
+
+    if resumen["duplicados_eliminados"]:
+        print("Duplicados eliminados.\n")
+    if resumen["duplicados_nuevos"] is not None:
+        print(f"Duplicados nuevos desde la última limpieza: {resumen['duplicados_nuevos']}\n")
+
+    media_detalle_ventas = resumen["media_importe"]
+    mediana_detalle_ventas = resumen["mediana_importe"]
+    moda_detalle_ventas = resumen["moda_importe"]
+    print(f"El importe promedio es: {media_detalle_ventas}")
+    print(f"El importe central: {mediana_detalle_ventas}")
+    print(f"El importe más frecuente es: {moda_detalle_ventas}\n")
+    _informar_columnas_eliminadas(resumen["columnas_eliminadas"])
+
+    if fuera_de_memoria:
+        print(f"Tabla limpia (Detalle_Ventas) guardada por bloques en: {df_detalle}")
+        print(resumen["muestra"])
+    else:
+        print("DataFrame limpio actualizado en memoria (Detalle_Ventas):")
+        print(df_detalle.head())
+    print("===================================================================")
+
+    if mostrar_graficos:
+        fig, axes = plt.subplots(1, 2, figsize=(10, 4.5))
+
+        # Histograma desde los conteos del perfil: igual al de la columna completa
+        conteo_importes = perfil["columnas"]["importe"]["conteos"]
+        axes[0].hist(
+            conteo_importes.index.to_numpy(dtype=float),
+            weights=conteo_importes.to_numpy(),
+            bins=15,
+            color='#4C72B0',
+            edgecolor='white',
+            alpha=0.8
+        )
+
+        axes[0].axvline(media_detalle_ventas, color='red', linestyle='--', linewidth=1.5, label='Media')
+        axes[0].axvline(mediana_detalle_ventas, color='green', linestyle='--', linewidth=1.5, label='Mediana')
+        axes[0].axvline(moda_detalle_ventas, color='orange', linestyle='--', linewidth=1.5, label='Moda')
+
+        axes[0].set_title("Distribución del Importe (Media, Mediana y Moda)", fontsize=9, pad=6)
+        axes[0].set_xlabel("Importe", fontsize=8)
+        axes[0].set_ylabel("Frecuencia", fontsize=8)
+        axes[0].legend(fontsize=7)
+        axes[0].grid(axis='y', linestyle='--', alpha=0.3)
+
+        df_corr = resumen["correlacion"]
+
+        sns.heatmap(
+            df_corr,
+            annot=True,
+            cmap="coolwarm",
+            fmt=".2f",
+            ax=axes[1],
+            cbar_kws={'shrink': 0.7}
+        )
+
+        axes[1].set_title("Matriz de Correlación - Detalle de Ventas", fontsize=9, pad=6)
+        axes[1].tick_params(axis='x', labelrotation=20, labelsize=8)
+        axes[1].tick_params(axis='y', labelrotation=0, labelsize=8)
+
+        texto_resumen = (
+            f"Filas originales: {resumen['filas_originales']} | "
+            f"Filas finales: {resumen['filas_finales']} | "
+            f"Duplicados elim.: {resumen['duplicados_eliminados']} | "
+            f"Nulos detectados: {resumen['nulos_detectados']}\n"
+            f"Media importe: {media_detalle_ventas:.2f} | "
+            f"Mediana: {mediana_detalle_ventas:.2f} | "
+            f"Moda: {moda_detalle_ventas:.2f}"
+        )
+
+        fig.suptitle("Análisis del Detalle de Ventas", fontsize=10, fontweight='bold', y=-0.02)
+        plt.figtext(
+            0.5, -0.08,
+            "El histograma muestra la dispersión del importe, y el mapa de calor refleja la correlación\n"
+            "entre cantidad e importe para analizar patrones de comportamiento en las ventas.\n\n" + texto_resumen,
+            ha='center',
+            fontsize=7,
+            color='black'
+        )
+
+        plt.tight_layout()
+        plt.show()
+
+    return df_detalle, resumen
+
+# ============================================================
+# EXPORTAR BD LIMPIA
+# ============================================================
+
+def formatos_exportacion_disponibles():
+    """Formatos cuyo motor está instalado."""
+    disponibles = {"xlsx": True, "xlsx_streaming": XLSXWRITER_DISPONIBLE,
+                   "parquet": PARQUET_DISPONIBLE, "csv": True}
+    return [formato for formato in FORMATOS_EXPORTACION if disponibles[formato]]
+
+
+def elegir_formato_exportacion():
+    formatos = formatos_exportacion_disponibles()
+    print("\nFormato de exportación:")
+    for i, formato in enumerate(formatos, start=1):
+        print(f"  {i}. {FORMATOS_EXPORTACION[formato]}")
+    opcion = input(f"Seleccione un formato (1-{len(formatos)}, ENTER = xlsx): ").strip()
+    if opcion.isdigit() and 1 <= int(opcion) <= len(formatos):
+        return formatos[int(opcion) - 1]
+    return "xlsx"
+
+
+def _bloques_tabla(tabla):
+    """
+    Bloques de una tabla a exportar: un DataFrame (de a TAMANO_BLOQUE filas;
+    al menos uno, aunque esté vacío) o la carpeta de una tabla limpiada
+    fuera de memoria (sus partes).
+    """
+    if isinstance(tabla, pd.DataFrame):
+        for inicio in range(0, max(len(tabla), 1), TAMANO_BLOQUE):
+            yield tabla.iloc[inicio:inicio + TAMANO_BLOQUE]
+    else:
+        yield from leer_tabla_fuera_de_memoria(tabla)
+
+
+def _tipos_estables(df, hoja):
+    """
+    Mismos dtypes en todas las partes de una tabla fuera de memoria (cada
+    bloque se tipó por separado): enteros del esquema a Int64 y categorías
+    a texto.
+    """
+    esquema = ESQUEMAS_HOJAS.get(hoja, {})
+    conversiones = {}
+    for columna in df.columns:
+        serie = df[columna]
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            conversiones[columna] = serie.astype(str).where(serie.notna())
+        elif esquema.get(columna) == "entero" and pd.api.types.is_numeric_dtype(serie):
+            conversiones[columna] = serie.astype("Int64")
+    return df.assign(**conversiones) if conversiones else df
+
+
+def _escribir_partes_parquet(carpeta, hoja, destino):
+    """Une las partes en un solo Parquet, de a una parte en memoria."""
+    escritor = None
+    try:
+        for parte in leer_tabla_fuera_de_memoria(carpeta):
+            parte = _tipos_estables(parte, hoja)
+            if escritor is None:
+                tabla = pyarrow.Table.from_pandas(parte, preserve_index=False)
+                escritor = pq.ParquetWriter(destino, tabla.schema, compression="zstd")
+            else:
+                tabla = pyarrow.Table.from_pandas(parte, schema=escritor.schema, preserve_index=False)
+            escritor.write_table(tabla)
+    finally:
+        if escritor is not None:
+            escritor.close()
+
+
+def _escribir_xlsx_streaming(tablas, ruta):
+    """
+    xlsxwriter en modo constant_memory: cada fila se vuelca a disco al
+    pasar a la siguiente, así que se escribe en orden, por bloques.
+    Las tablas pueden ser DataFrames o carpetas fuera de memoria.
+    """
+    libro = xlsxwriter.Workbook(ruta, {
+        "constant_memory": True,
+        "default_date_format": "yyyy-mm-dd hh:mm:ss",
+    })
+    try:
+        formato_encabezado = libro.add_format({"bold": True, "border": 1, "align": "center"})
+        for hoja, df in tablas.items():
+            hoja_xlsx = libro.add_worksheet(hoja)
+            fila = 0
+            for bloque in _bloques_tabla(df):
+                if fila == 0:
+                    hoja_xlsx.write_row(0, 0, [str(col) for col in bloque.columns], formato_encabezado)
+                    fila = 1
+                bloque = bloque.astype(object)
+                # Celdas vacías para NaN / NaT (xlsxwriter no acepta NaN)
+                bloque = bloque.where(bloque.notna(), None)
+                for valores in bloque.itertuples(index=False, name=None):
+                    hoja_xlsx.write_row(fila, 0, valores)
+                    fila += 1
+    finally:
+        libro.close()
+
+
+def _carpeta_exportacion(formato):
+    carpeta = Path(os.path.splitext(RUTA_SALIDA)[0] + f"_{formato}")
+    carpeta.mkdir(parents=True, exist_ok=True)
+    return carpeta
+
+
+def _preparar_tabla_exportacion(hoja, datos, df_map, formato, carpeta):
+    """
+    Limpia una tabla y, en los formatos de un archivo por tabla, la escribe.
+    Devuelve la tabla limpia. Si `datos` es la carpeta de una tabla ya
+    limpiada fuera de memoria, se copia parte por parte y se devuelve la carpeta.
+    """
+    if isinstance(datos, (str, Path)):
+        if formato == "parquet":
+            _escribir_partes_parquet(datos, hoja, carpeta / f"{hoja}.parquet")
+        elif formato == "csv":
+            for numero, parte in enumerate(leer_tabla_fuera_de_memoria(datos)):
+                _tipos_estables(parte, hoja).to_csv(
+                    carpeta / f"{hoja}.csv", mode="a" if numero else "w", header=numero == 0, index=False
+                )
+        return datos
+
+    df = df_map if hoja == "Mapeo_Categorias" else limpiar_tabla(hoja, datos, df_map)[0]
+    if formato == "parquet":
+        df.to_parquet(carpeta / f"{hoja}.parquet", index=False, compression="zstd")
+    elif formato == "csv":
+        df.to_csv(carpeta / f"{hoja}.csv", index=False, chunksize=TAMANO_BLOQUE)
+    return df
+
+
+def exportar_bd_limpia(df_cliente, df_detalle, df_producto, df_ventas, df_map, formato="xlsx", paralelo=None):
+    """
+    Exporta la BD limpia en `formato` (ver FORMATOS_EXPORTACION).
+    Con paralelo=True (o AURELION_EXPORTACION_PARALELA=1) cada tabla se
+    limpia en su propio hilo y, en Parquet/CSV, también se escribe ahí;
+    un .xlsx es un único archivo, así que sus hojas se escriben después, en orden.
+    Ventas y Detalle_Ventas pueden llegar como la carpeta que devuelve
+    limpiar_fuera_de_memoria(): se exportan desde sus partes sin cargarlas
+    enteras (en xlsx, con el escritor en streaming si xlsxwriter está instalado).
+    Devuelve la ruta del .xlsx o de la carpeta con un archivo por tabla.
+    """
+    if formato not in formatos_exportacion_disponibles():
+        raise ValueError(f"Formato de exportación no disponible: {formato}")
+    paralelo = EXPORTACION_PARALELA if paralelo is None else paralelo
+
+    entradas = {
+        "Clientes": df_cliente,
+        "Productos": df_producto,
+        "Ventas": df_ventas,
+        "Detalle_Ventas": df_detalle,
+        "Mapeo_Categorias": df_map,
+    }
+    carpeta = None if formato in ("xlsx", "xlsx_streaming") else _carpeta_exportacion(formato)
+
+    # Solo el pipeline: sin prints de head()/nulos ni gráficos
+    if paralelo:
+        with ThreadPoolExecutor(max_workers=len(entradas)) as ejecutor:
+            futuros = {
+                hoja: ejecutor.submit(_preparar_tabla_exportacion, hoja, datos, df_map, formato, carpeta)
+                for hoja, datos in entradas.items()
+            }
+            tablas = {hoja: futuro.result() for hoja, futuro in futuros.items()}
+    else:
+        tablas = {
+            hoja: _preparar_tabla_exportacion(hoja, datos, df_map, formato, carpeta)
+            for hoja, datos in entradas.items()
+        }
+
+    fuera_de_memoria = any(not isinstance(df, pd.DataFrame) for df in tablas.values())
+    if formato == "xlsx" and fuera_de_memoria and XLSXWRITER_DISPONIBLE:
+        formato = "xlsx_streaming"
+
+    if formato == "xlsx":
+        with pd.ExcelWriter(RUTA_SALIDA, engine="openpyxl") as writer:
+            for hoja, df in tablas.items():
+                if not isinstance(df, pd.DataFrame):
+                    df = _concatenar_bloques(list(leer_tabla_fuera_de_memoria(df)))
+                df.to_excel(writer, sheet_name=hoja, index=False)
+        return RUTA_SALIDA
+
+    if formato == "xlsx_streaming":
+        _escribir_xlsx_streaming(tablas, RUTA_SALIDA)
+        return RUTA_SALIDA
+
+    return str(carpeta)
+
+# ============================================================
+# SPRINT 3 – MODELOS ML AURELION (Con UX Mejorada)
+# ============================================================
+
+# Variables globales del contexto ML
+_sprint3_inicializado = False
+
+df_prod_ml = None
+df_detalle_ml = None
+df_mensual_ml = None
+df_ml = None
+
+modelo_reg = None
+X_train = X_test = y_train = y_test = y_pred = None
+q1 = q2 = None
+df_clf = None
+
+# (clave, contenido) con que modelo_reg quedó en la caché de modelos
+_modelo_reg_guardado = None
+
+# Hiperparámetros del modelo de regresión y de la partición train/test
+PARAMETROS_REGRESION = {
+    "n_estimators": 200,
+    "learning_rate": 0.05,
+    "max_depth": 5,
+    "subsample": 0.9,
+    "random_state": 42,
+}
+PARAMETROS_PARTICION = {"test_size": 0.2, "random_state": 42}
+
+# Motor del modelo de regresión (AURELION_MOTOR_REGRESION):
+# - "gbr": GradientBoostingRegressor, splits exactos sobre one-hot
+# - "hist": HistGradientBoostingRegressor, splits por histogramas, categoría
+#   nativa (sin one-hot) y entrenamiento multihilo (OpenMP)
+MOTORES_REGRESION = {
+    "gbr": "GradientBoostingRegressor",
+    "hist": "HistGradientBoostingRegressor",
+}
+MOTOR_REGRESION = os.environ.get("AURELION_MOTOR_REGRESION", "gbr")
+
+PARAMETROS_REGRESION_HIST = {
+    "max_iter": 200,
+    "learning_rate": 0.05,
+    "max_depth": 5,
+    "early_stopping": False,
+    "random_state": 42,
+}
+
+# Reglas de etiquetado de Sprint 3
+CUANTIL_NIVEL_BAJO = 0.30      # cantidad <= q1 -> BAJO
+CUANTIL_NIVEL_TOP = 0.80       # cantidad >= q2 -> TOP
+UMBRAL_RIESGO_MEDIO = 1.5      # stock_actual < stock_minimo * 1.5 -> MEDIO_RIESGO
+UMBRAL_TOP_CRITICO = 1.2       # TOP con stock_actual < stock_minimo * 1.2 -> crítico
+
+# Modelos entrenados guardados en disco (se reentrena solo si cambian datos o config)
+CACHE_MODELOS = os.environ.get("AURELION_CACHE_MODELOS", "1") == "1"
+
+# Reentrenamiento incremental (opcional): si solo llegaron meses nuevos, se
+# agregan ESTADIOS_INCREMENTALES etapas de boosting (warm start) al modelo
+# guardado, hasta ESTADIOS_MAXIMOS en total; pasado el tope se reajusta.
+# Solo con el motor "gbr": HistGradientBoosting vuelve a armar sus bins al
+# ajustar, así que su warm start únicamente vale con los mismos datos (y el
+# ajuste completo tarda menos de un segundo).
+# Se vuelve a un ajuste completo si hay deriva: MAE en los meses nuevos
+# mayor a UMBRAL_DERIVA_MAE veces el MAE de test, o la media de la demanda
+# nueva corrida más de UMBRAL_DERIVA_MEDIA desvíos de la de entrenamiento;
+# y también si, sobre el mismo test extendido, el modelo extendido queda con
+# peor MAE que el guardado sin extender.
+# Apagado por defecto: con el libro incluido el modelo extendido no mejora al
+# guardado y el intento solo se suma al ajuste completo.
+REENTRENAMIENTO_INCREMENTAL = os.environ.get("AURELION_REENTRENAMIENTO_INCREMENTAL", "0") == "1"
+ESTADIOS_INCREMENTALES = 50
+ESTADIOS_MAXIMOS = 400
+UMBRAL_DERIVA_MAE = 1.5
+UMBRAL_DERIVA_MEDIA = 0.5
+
+# Un modelo de demanda por categoria_general, entrenados en paralelo (procesos)
+MODELO_POR_CATEGORIA = os.environ.get("AURELION_MODELO_POR_CATEGORIA", "0") == "1"
+
+# ============================================================
+# CACHÉ DE MODELOS (joblib, por huella de datos + configuración)
+# ============================================================
+
+def clave_modelo(tablas, configuracion):
+    """
+    Hash de las tablas de entrada (por contenido), de la configuración del
+    modelo y de la versión de scikit-learn (un pickle de otra versión no
+    es confiable).
+    """
+    h = hashlib.sha256()
+    for df in tablas:
+        h.update(huella_tabla(df).encode("ascii"))
+    h.update(json.dumps(configuracion, sort_keys=True, default=str).encode("utf-8"))
+    h.update(sklearn.__version__.encode("ascii"))
+    return h.hexdigest()
+
+
+def _ruta_modelo(nombre, clave):
+    return CARPETA_CACHE / "modelos" / f"{nombre}_{clave}.joblib"
+
+
+def cargar_modelo_cacheado(nombre, clave):
+    """Devuelve lo guardado con guardar_modelo_cacheado() o None si no hay."""
+    ruta = _ruta_modelo(nombre, clave)
+    if not CACHE_MODELOS or not ruta.exists():
+        return None
+    try:
+        return joblib.load(ruta)
+    except Exception as e:
+        print(f"\n⚠ No se pudo leer el modelo guardado ({nombre}): {str(e)}")
+        return None
+
+
+def ultimo_modelo_cacheado(nombre):
+    """El modelo `nombre` guardado más reciente, sea cual sea su clave (o None)."""
+    carpeta = CARPETA_CACHE / "modelos"
+    if not CACHE_MODELOS or not carpeta.exists():
+        return None
+    guardados = sorted(carpeta.glob(f"{nombre}_*.joblib"), key=lambda ruta: ruta.stat().st_mtime)
+    if not guardados:
+        return None
+    return cargar_modelo_cacheado(nombre, guardados[-1].stem[len(nombre) + 1:])
+
+
+def guardar_modelo_cacheado(nombre, clave, contenido):
+    """
+    Escribe `contenido` (dict con modelo, particiones, métricas...) y borra
+    las versiones anteriores de ese modelo. Devuelve True si quedó escrito.
+    """
+    if not CACHE_MODELOS:
+        return False
+    ruta = _ruta_modelo(nombre, clave)
+    try:
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        ruta_tmp = ruta.with_suffix(".tmp")
+        joblib.dump(contenido, ruta_tmp)
+        os.replace(ruta_tmp, ruta)
+    except Exception as e:
+        print(f"\n⚠ No se pudo guardar el modelo ({nombre}): {str(e)}")
+        return False
+
+    for anterior in ruta.parent.glob(f"{nombre}_*.joblib"):
+        if anterior != ruta:
+            anterior.unlink(missing_ok=True)
+    return True
+
+# ============================================================
+# PREPROCESADOR – columnas numéricas y categóricas
+# ============================================================
+
+NUM_COLS_REGRESION = [
+    "anio", "mes", "precio_unitario", "costo_producto",
+    "margen_ganancia", "porcentaje_margen",
+    "stock_actual", "stock_minimo"
+]
+CAT_COLS_REGRESION = ["categoria_general"]
+
+# Columnas del modelo de regresión (en este orden) y objetivo
+X_COLS_REGRESION = [
+    "anio", "mes", "categoria_general", "precio_unitario",
+    "costo_producto", "margen_ganancia",
+    "porcentaje_margen", "stock_actual", "stock_minimo"
+]
+Y_COL_REGRESION = "cantidad"
+
+
+def porcentaje_a_float(serie):
+    """'23%' / '23,5%' -> 23.0 / 23.5"""
+    return (
+        serie
+        .astype(str)
+        .str.replace("%", "")
+        .str.replace(",", ".")
+        .astype(float)
+    )
+
+
+def build_preprocessor():
+    return ColumnTransformer(
+        [
+            ("num", StandardScaler(), NUM_COLS_REGRESION),
+            ("cat", OneHotEncoder(handle_unknown="ignore"), CAT_COLS_REGRESION)
+        ]
+    )
+
+
+def build_preprocessor_hist():
+    # Los árboles no necesitan escalar; la categoría va como código ordinal
+    # (primera columna) y una categoría nueva queda como faltante
+    return ColumnTransformer(
+        [
+            ("cat", OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=np.nan), CAT_COLS_REGRESION),
+            ("num", "passthrough", NUM_COLS_REGRESION)
+        ]
+    )
+
+
+def parametros_regresion(motor=None):
+    motor = MOTOR_REGRESION if motor is None else motor
+    return PARAMETROS_REGRESION_HIST if motor == "hist" else PARAMETROS_REGRESION
+
+
+def construir_modelo_regresion(motor=None):
+    """Pipeline sin entrenar del motor indicado (por defecto MOTOR_REGRESION)."""
+    motor = MOTOR_REGRESION if motor is None else motor
+    if motor not in MOTORES_REGRESION:
+        raise ValueError(f"Motor de regresión desconocido: {motor}")
+
+    if motor == "hist":
+        return Pipeline(
+            [
+                ("prep", build_preprocessor_hist()),
+                ("gbr", HistGradientBoostingRegressor(
+                    categorical_features=list(range(len(CAT_COLS_REGRESION))),
+                    **PARAMETROS_REGRESION_HIST
+                ))
+            ]
+        )
+    return Pipeline(
+        [
+            ("prep", build_preprocessor()),
+            ("gbr", GradientBoostingRegressor(**PARAMETROS_REGRESION))
+        ]
+    )
+
+
+def configuracion_regresion():
+    """Todo lo que define al modelo_reg entrenado, para las claves de caché."""
+    return {
+        "motor": MOTOR_REGRESION, "regresion": parametros_regresion(),
+        "particion": PARAMETROS_PARTICION, "por_categoria": MODELO_POR_CATEGORIA,
+        "incremental": REENTRENAMIENTO_INCREMENTAL,
+        "caracteristicas": {
+            "X": X_COLS_REGRESION, "numericas": NUM_COLS_REGRESION,
+            "categoricas": CAT_COLS_REGRESION, "objetivo": Y_COL_REGRESION,
+        },
+    }
+
+
+def _metricas_regresion(y_real, y_estimado):
+    """MAE, RMSE y R² (NaN con menos de dos filas)."""
+    return {
+        "MAE": float(mean_absolute_error(y_real, y_estimado)),
+        "RMSE": float(sqrt(mean_squared_error(y_real, y_estimado))),
+        "R²": float(r2_score(y_real, y_estimado)) if len(y_real) > 1 else np.nan,
+    }
+
+def indice_periodo(df):
+    """(anio, mes) como un entero correlativo: anio * 12 + mes - 1."""
+    return df["anio"].astype(int) * 12 + df["mes"].astype(int) - 1
+
+
+def reentrenar_incremental(previo, X, y):
+    """
+    Extiende el modelo guardado `previo` con los meses que no conocía:
+    - los meses ya vistos deben estar intactos (misma huella)
+    - las filas nuevas se parten con la misma regla train/test y se suman
+      a la partición guardada
+    - el preprocesador ya ajustado solo transforma; el paso "gbr" agrega
+      ESTADIOS_INCREMENTALES etapas con warm_start (hasta ESTADIOS_MAXIMOS)
+    Devuelve el contenido a guardar, o None si corresponde un ajuste completo
+    (motor hist, tope de etapas, nada nuevo, historia modificada, deriva sobre
+    los umbrales o modelo extendido peor que el guardado en el mismo test).
+    """
+    gbr = previo["modelo"].named_steps["gbr"]
+    if isinstance(gbr, HistGradientBoostingRegressor):
+        return None
+    estadios = gbr.n_estimators + ESTADIOS_INCREMENTALES
+    if estadios > ESTADIOS_MAXIMOS:
+        print(f"⚠ El modelo guardado ya tiene {gbr.n_estimators} etapas (tope {ESTADIOS_MAXIMOS}): "
+              "ajuste completo.")
+        return None
+
+    periodos_previos = set(previo.get("periodos", []))
+    periodos_mensual = indice_periodo(df_mensual_ml)
+    if not periodos_previos or not periodos_previos < set(periodos_mensual.unique().tolist()):
+        return None
+    if huella_tabla(df_mensual_ml[periodos_mensual.isin(periodos_previos)]) != previo.get("huella_historico"):
+        return None
+
+    nuevas = ~indice_periodo(X).isin(periodos_previos)
+    X_nuevo, y_nuevo = X[nuevas], y[nuevas]
+    if X_nuevo.empty:
+        return None
+
+    modelo = previo["modelo"]
+    mae_nuevo = mean_absolute_error(y_nuevo, modelo.predict(X_nuevo))
+    desvio_previo = previo["y_train"].std()
+    corrimiento = abs(y_nuevo.mean() - previo["y_train"].mean()) / desvio_previo if desvio_previo else 0.0
+    if mae_nuevo > previo["metricas"][0] * UMBRAL_DERIVA_MAE or corrimiento > UMBRAL_DERIVA_MEDIA:
+        print(f"⚠ Deriva en los meses nuevos (MAE {mae_nuevo:.4f}, corrimiento {corrimiento:.2f} desvíos): "
+              "ajuste completo.")
+        return None
+
+    if len(X_nuevo) >= 2:
+        X_nuevo_train, X_nuevo_test, y_nuevo_train, y_nuevo_test = train_test_split(
+            X_nuevo, y_nuevo, **PARAMETROS_PARTICION
+        )
+    else:
+        X_nuevo_train, X_nuevo_test, y_nuevo_train, y_nuevo_test = X_nuevo, X_nuevo.iloc[:0], y_nuevo, y_nuevo.iloc[:0]
+
+    X_train = pd.concat([previo["X_train"], X_nuevo_train])
+    X_test = pd.concat([previo["X_test"], X_nuevo_test])
+    y_train = pd.concat([previo["y_train"], y_nuevo_train])
+    y_test = pd.concat([previo["y_test"], y_nuevo_test])
+
+    # Referencia: el modelo guardado, sin extender, sobre el mismo test extendido
+    mae_guardado = mean_absolute_error(y_test, modelo.predict(X_test))
+
+    gbr.set_params(warm_start=True, n_estimators=estadios)
+    gbr.fit(modelo.named_steps["prep"].transform(X_train), y_train)
+    gbr.set_params(warm_start=False)
+    y_pred = modelo.predict(X_test)
+    metricas = tuple(_metricas_regresion(y_test, y_pred).values())
+
+    if metricas[0] > mae_guardado:
+        print(f"⚠ El modelo extendido empeora el MAE de test ({metricas[0]:.4f} > "
+              f"{mae_guardado:.4f}): ajuste completo.")
+        return None
+
+    meses_nuevos = len(set(indice_periodo(X_nuevo).unique().tolist()))
+    print(f"✔ Modelo extendido con {meses_nuevos} mes(es) nuevo(s) "
+          f"(+{ESTADIOS_INCREMENTALES} etapas, {estadios} en total).")
+    configuracion = configuracion_regresion()
+    configuracion["regresion"] = {**configuracion["regresion"], "n_estimators": estadios}
+    return {
+        "modelo": modelo,
+        "X_train": X_train, "X_test": X_test,
+        "y_train": y_train, "y_test": y_test,
+        "y_pred": y_pred,
+        "metricas": metricas,
+        "configuracion": configuracion,
+    }
+
+# ============================================================
+# MODELO MENSUAL (demanda total por mes)
+# ============================================================
 
-    return df_ventas, resumen
+PARAMETROS_MODELO_MENSUAL = {
+    "n_estimators": 300,
+    "learning_rate": 0.05,
+    "max_depth": 4,
+    "subsample": 0.9,
+    "random_state": 42,
+}
+X_COLS_MENSUAL = ["mes_num", "rolling_3", "precio_promedio", "costo_promedio"]
+Y_COL_MENSUAL = "cantidad_total"
 
 
-def limpiar_analizar_detalle(df_detalle, mostrar_graficos=True):
-    filas_originales = len(df_detalle)
-    nulos_totales = df_detalle.isnull().sum().sum()
-    duplicados_iniciales = df_detalle.duplicated().sum()
+def construir_serie_mensual():
+    """Dataset_Mensual agregado a un registro por mes, ordenado, con sus features."""
+    df_mes = (
+        df_mensual_ml.groupby(["anio", "mes"])
+        .agg(
+            cantidad_total=("cantidad", "sum"),
+            precio_promedio=("precio", "mean"),
+            costo_promedio=("costo", "mean")
+        )
+        .reset_index()
+    )
 
-    print("\n==================== DETALLE DE VENTAS ============================")
-    print("Registros nulos por columna en Detalle_Ventas:")
-    print(df_detalle.isnull().sum())
+    df_mes["fecha"] = pd.to_datetime(
+        df_mes["anio"].astype(str) + "-" + df_mes["mes"].astype(str) + "-01"
+    )
+    df_mes = df_mes.sort_values("fecha")
+    df_mes["mes_num"] = np.arange(1, len(df_mes) + 1)
+    df_mes["rolling_3"] = df_mes["cantidad_total"].rolling(3).mean().bfill()
+    return df_mes
 
-    duplicados = df_detalle.duplicated().sum()
-    if duplicados > 0:
-        df_detalle = df_detalle.drop_duplicates()
-        print("Duplicados eliminados.\n")
 
-    media_detalle_ventas = df_detalle['importe'].mean()
-    mediana_detalle_ventas = df_detalle['importe'].median()
-    moda_detalle_ventas = df_detalle['importe'].mode()[0]
-    print(f"El importe promedio es: {media_detalle_ventas}")
-    print(f"El importe central: {mediana_detalle_ventas}")
-    print(f"El importe más frecuente es: {moda_detalle_ventas}\n")
+def construir_modelo_mensual():
+    return GradientBoostingRegressor(**PARAMETROS_MODELO_MENSUAL)
 
-    columnas_redundantes = ['nombre_producto', 'precio_unitario']
-    columnas_existentes = [col for col in columnas_redundantes if col in df_detalle.columns]
-    if columnas_existentes:
-        df_detalle = df_detalle.drop(columns=columnas_existentes)
-        print(f"Columnas eliminadas: {columnas_existentes}\n")
-    else:
-        print("No había columnas redundantes para eliminar.\n")
+# ============================================================
+# MODELOS POR CATEGORÍA (un shard por categoria_general)
+# ============================================================
 
-    print("DataFrame limpio actualizado en memoria (Detalle_Ventas):")
-    print(df_detalle.head())
-    print("===================================================================")
+class ModeloPorCategoria:
+    """
+    Un pipeline de regresión por categoria_general. predict() enruta cada
+    fila al modelo de su categoría; una categoría sin modelo recibe la
+    media de entrenamiento. Se usa igual que modelo_reg (fit ya hecho).
+    """
 
-    filas_finales = len(df_detalle)
-    resumen = {
-        "filas_originales": filas_originales,
-        "filas_finales": filas_finales,
-        "duplicados_eliminados": duplicados_iniciales,
-        "nulos_detectados": nulos_totales,
-        "media_importe": media_detalle_ventas,
-        "mediana_importe": mediana_detalle_ventas,
-        "moda_importe": moda_detalle_ventas
-    }
+    def __init__(self, motor=None):
+        self.motor = MOTOR_REGRESION if motor is None else motor
+        self.modelos = {}
+        self.segundos = {}
+        self.media_global = np.nan
 
-    if mostrar_graficos:
-        fig, axes = plt.subplots(1, 2, figsize=(10, 4.5))
+    def predict(self, X):
+        categorias = X["categoria_general"].astype(object).to_numpy()
+        prediccion = np.full(len(X), self.media_global, dtype=float)
+        for categoria, modelo in self.modelos.items():
+            filas = categorias == categoria
+            if filas.any():
+                prediccion[filas] = modelo.predict(X[filas])
+        return prediccion
 
-        axes[0].hist(
-            df_detalle['importe'],
-            bins=15,
-            color='#4C72B0',
-            edgecolor='white',
-            alpha=0.8
-        )
 
-        axes[0].axvline(df_detalle['importe'].mean(), color='red', linestyle='--', linewidth=1.5, label='Media')
-        axes[0].axvline(df_detalle['importe'].median(), color='green', linestyle='--', linewidth=1.5, label='Mediana')
-        axes[0].axvline(df_detalle['importe'].mode()[0], color='orange', linestyle='--', linewidth=1.5, label='Moda')
+def _entrenar_shard(categoria, X, y, motor):
+    # Se ejecuta en otro proceso: entrena el pipeline de una sola categoría
+    inicio = time.perf_counter()
+    modelo = construir_modelo_regresion(motor)
+    modelo.fit(X, y)
+    return categoria, modelo, time.perf_counter() - inicio
 
-        axes[0].set_title("Distribución del Importe (Media, Mediana y Moda)", fontsize=9, pad=6)
-        axes[0].set_xlabel("Importe", fontsize=8)
-        axes[0].set_ylabel("Frecuencia", fontsize=8)
-        axes[0].legend(fontsize=7)
-        axes[0].grid(axis='y', linestyle='--', alpha=0.3)
 
-        df_corr = df_detalle[["cantidad", "importe"]].corr()
+def entrenar_modelo_por_categoria(X_train, y_train, motor=None, categorias=None, modelo=None, paralelo=True):
+    """
+    Entrena en un pool de procesos un pipeline por categoría de X_train.
+    Con `categorias` + `modelo` reentrena solo esas categorías del modelo
+    existente y deja las demás intactas. Con paralelo=False los shards se
+    entrenan en este proceso (p. ej. dentro de un pliegue ya paralelo).
+    """
+    modelo = ModeloPorCategoria(motor) if modelo is None else modelo
+    modelo.media_global = float(y_train.mean())
 
-        sns.heatmap(
-            df_corr,
-            annot=True,
-            cmap="coolwarm",
-            fmt=".2f",
-            ax=axes[1],
-            cbar_kws={'shrink': 0.7}
-        )
+    categoria_fila = X_train["categoria_general"].astype(object)
+    if categorias is None:
+        categorias = sorted(categoria_fila.dropna().unique())
 
-        axes[1].set_title("Matriz de Correlación - Detalle de Ventas", fontsize=9, pad=6)
-        axes[1].tick_params(axis='x', labelrotation=20, labelsize=8)
-        axes[1].tick_params(axis='y', labelrotation=0, labelsize=8)
+    tareas = [
+        (categoria, X_train[categoria_fila == categoria], y_train[categoria_fila == categoria], modelo.motor)
+        for categoria in categorias
+        if (categoria_fila == categoria).any()
+    ]
+    if paralelo:
+        with ProcessPoolExecutor(max_workers=min(len(categorias), os.cpu_count() or 1),
+                                 mp_context=CONTEXTO_PROCESOS) as ejecutor:
+            futuros = [ejecutor.submit(_entrenar_shard, *tarea) for tarea in tareas]
+            resultados = [futuro.result() for futuro in futuros]
+    else:
+        resultados = [_entrenar_shard(*tarea) for tarea in tareas]
 
-        texto_resumen = (
-            f"Filas originales: {resumen['filas_originales']} | "
-            f"Filas finales: {resumen['filas_finales']} | "
-            f"Duplicados elim.: {resumen['duplicados_eliminados']} | "
-            f"Nulos detectados: {resumen['nulos_detectados']}\n"
-            f"Media importe: {media_detalle_ventas:.2f} | "
-            f"Mediana: {mediana_detalle_ventas:.2f} | "
-            f"Moda: {moda_detalle_ventas:.2f}"
-        )
+    for categoria, modelo_shard, segundos in resultados:
+        modelo.modelos[categoria] = modelo_shard
+        modelo.segundos[categoria] = segundos
+    return modelo
 
-        fig.suptitle("Análisis del Detalle de Ventas", fontsize=10, fontweight='bold', y=-0.02)
-        plt.figtext(
-            0.5, -0.08,
-            "El histograma muestra la dispersión del importe, y el mapa de calor refleja la correlación\n"
-            "entre cantidad e importe para analizar patrones de comportamiento en las ventas.\n\n" + texto_resumen,
-            ha='center',
-            fontsize=7,
-            color='black'
-        )
 
-        plt.tight_layout()
-        plt.show()
+def reentrenar_categoria(modelo, categoria, X_train, y_train):
+    """Reentrena un único shard sin tocar los demás."""
+    return entrenar_modelo_por_categoria(X_train, y_train, categorias=[categoria], modelo=modelo)
 
-    return df_detalle, resumen
 
-# ============================================================
-# EXPORTAR BD LIMPIA
-# ============================================================
+def metricas_por_categoria(modelo, X_test, y_test):
+    """MAE / RMSE / R² de cada shard y del conjunto (fila TOTAL)."""
+    prediccion = modelo.predict(X_test)
+    categoria_fila = X_test["categoria_general"].astype(object).to_numpy()
 
-def exportar_bd_limpia(df_cliente, df_detalle, df_producto, df_ventas, df_map):
-    df_cliente_limpio, _ = limpiar_analizar_clientes(df_cliente, mostrar_graficos=False)
-    df_producto_limpio, _ = limpiar_analizar_productos(df_producto, df_map, mostrar_graficos=False)
-    df_ventas_limpio, _ = limpiar_analizar_ventas(df_ventas, mostrar_graficos=False)
-    df_detalle_limpio, _ = limpiar_analizar_detalle(df_detalle, mostrar_graficos=False)
+    def metricas(nombre, filas):
+        y_real, y_estimado = y_test.to_numpy()[filas], prediccion[filas]
+        return {
+            "Categoría": nombre,
+            "Filas test": int(filas.sum()),
+            "Ajuste (s)": getattr(modelo, "segundos", {}).get(nombre, np.nan),
+            **_metricas_regresion(y_real, y_estimado),
+        }
 
-    with pd.ExcelWriter(RUTA_SALIDA, engine="openpyxl") as writer:
-        df_cliente_limpio.to_excel(writer, sheet_name="Clientes", index=False)
-        df_producto_limpio.to_excel(writer, sheet_name="Productos", index=False)
-        df_ventas_limpio.to_excel(writer, sheet_name="Ventas", index=False)
-        df_detalle_limpio.to_excel(writer, sheet_name="Detalle_Ventas", index=False)
-        df_map.to_excel(writer, sheet_name="Mapeo_Categorias", index=False)
+    filas = [metricas(categoria, categoria_fila == categoria) for categoria in sorted(set(categoria_fila))]
+    total = metricas("TOTAL", np.ones(len(X_test), dtype=bool))
+    total["Ajuste (s)"] = sum(getattr(modelo, "segundos", {}).values()) or np.nan
+    return pd.DataFrame(filas + [total])
 
-    return RUTA_SALIDA
 # ============================================================
-# SPRINT 3 – MODELOS ML AURELION (Con UX Mejorada)
+# VALIDACIÓN CRUZADA TEMPORAL (origen móvil, pliegues en paralelo)
 # ============================================================
+# Cada pliegue entrena con todos los meses hasta un origen y evalúa los
+# HORIZONTE_CV_MESES siguientes; el origen avanza pliegue a pliegue.
+# Los pliegues corren en paralelo (joblib, procesos) y su resultado se
+# guarda por huella de datos + configuración: solo se evalúa lo nuevo.
+
+PLIEGUES_CV = 5
+HORIZONTE_CV_MESES = 3
+
+
+def _pliegues_temporales(periodos, pliegues, horizonte):
+    """[(periodos_train, periodos_test), ...] con origen móvil (ventana creciente)."""
+    periodos = sorted(set(periodos))
+    resultado = []
+    for k in range(pliegues, 0, -1):
+        fin_train = len(periodos) - horizonte - (k - 1) * horizonte
+        if fin_train < 2:
+            continue
+        resultado.append((periodos[:fin_train], periodos[fin_train:fin_train + horizonte]))
+    return resultado
 
-# Variables globales del contexto ML
-_sprint3_inicializado = False
 
-df_prod_ml = None
-df_detalle_ml = None
-df_mensual_ml = None
-df_ml = None
+def _evaluar_pliegue(modelo, motor, por_categoria, X_train, y_train, X_test, y_test):
+    # Se ejecuta en un proceso de joblib; los shards, en serie dentro del pliegue
+    inicio = time.perf_counter()
+    if modelo == "mensual":
+        estimador = construir_modelo_mensual().fit(X_train, y_train)
+    elif por_categoria:
+        estimador = entrenar_modelo_por_categoria(X_train, y_train, motor, paralelo=False)
+    else:
+        estimador = construir_modelo_regresion(motor).fit(X_train, y_train)
+    segundos = time.perf_counter() - inicio
+    return {**_metricas_regresion(y_test, estimador.predict(X_test)), "Ajuste (s)": segundos}
 
-modelo_reg = None
-X_train = X_test = y_train = y_test = y_pred = None
-q1 = q2 = None
-df_clf = None
 
-# ============================================================
-# PREPROCESADOR – columnas numéricas y categóricas
-# ============================================================
+def validacion_cruzada_temporal(modelo="regresion", pliegues=None, horizonte=None, n_jobs=-1):
+    """
+    Validación de origen móvil de `modelo` ("regresion": modelo_reg sobre
+    df_ml, global o por categoría según MODELO_POR_CATEGORIA; "mensual":
+    modelo_mensual sobre la serie mensual).
+    En CARPETA_CACHE/cv/<modelo> quedan solo los pliegues de la última corrida.
+    Devuelve (df_pliegues, resumen) con media y desvío de MAE/RMSE/R².
+    """
+    inicializar_sprint3()
+    pliegues = PLIEGUES_CV if pliegues is None else pliegues
+    horizonte = HORIZONTE_CV_MESES if horizonte is None else horizonte
 
-def build_preprocessor():
-    num_cols = [
-        "anio", "mes", "precio_unitario", "costo_producto",
-        "margen_ganancia", "porcentaje_margen",
-        "stock_actual", "stock_minimo"
-    ]
-    cat_cols = ["categoria_general"]
+    if modelo == "mensual":
+        datos = construir_serie_mensual()
+        X, y = datos[X_COLS_MENSUAL], datos[Y_COL_MENSUAL]
+        configuracion = {"modelo": modelo, "parametros": PARAMETROS_MODELO_MENSUAL}
+    else:
+        datos = df_ml
+        X, y = datos[X_COLS_REGRESION], datos[Y_COL_REGRESION]
+        configuracion = {"modelo": modelo, **configuracion_regresion()}
+    periodo = indice_periodo(datos)
+    huella_datos = pd.concat([X, y], axis=1)
+
+    carpeta = CARPETA_CACHE / "cv" / modelo
+    tareas, resultados, vigentes = {}, {}, set()
+    for numero, (periodos_train, periodos_test) in enumerate(_pliegues_temporales(periodo, pliegues, horizonte), start=1):
+        clave = clave_modelo([huella_datos], {**configuracion, "train": periodos_train, "test": periodos_test})
+        ruta = carpeta / f"{clave}.json"
+        vigentes.add(ruta)
+        if CACHE_MODELOS and ruta.exists():
+            with open(ruta, encoding="utf-8") as f:
+                resultados[numero] = json.load(f)
+            continue
+        en_train, en_test = periodo.isin(periodos_train), periodo.isin(periodos_test)
+        tareas[numero] = (ruta, (X[en_train], y[en_train], X[en_test], y[en_test]))
 
-    return ColumnTransformer(
-        [
-            ("num", StandardScaler(), num_cols),
-            ("cat", OneHotEncoder(handle_unknown="ignore"), cat_cols)
-        ]
-    )
+    if tareas:
+        evaluados = joblib.Parallel(n_jobs=n_jobs)(
+            joblib.delayed(_evaluar_pliegue)(modelo, MOTOR_REGRESION, MODELO_POR_CATEGORIA, *particion)
+            for _, particion in tareas.values()
+        )
+        for (numero, (ruta, _)), metricas in zip(tareas.items(), evaluados):
+            resultados[numero] = metricas
+            if CACHE_MODELOS:
+                ruta.parent.mkdir(parents=True, exist_ok=True)
+                with open(ruta, "w", encoding="utf-8") as f:
+                    json.dump(metricas, f)
+
+    # Los pliegues de datos o configuraciones anteriores ya no se van a pedir
+    if carpeta.exists():
+        for ruta in carpeta.glob("*.json"):
+            if ruta not in vigentes:
+                ruta.unlink(missing_ok=True)
+
+    df_pliegues = pd.DataFrame.from_dict(resultados, orient="index").sort_index()
+    df_pliegues.index.name = "Pliegue"
+    resumen = {
+        metrica: (df_pliegues[metrica].mean(), df_pliegues[metrica].std())
+        for metrica in ("MAE", "RMSE", "R²")
+    }
+    return df_pliegues, resumen
+
+def actualizar_modelo_reg():
+    """
+    Tras modificar modelo_reg (p. ej. reentrenar un shard) recalcula y_pred
+    y sus métricas y lo vuelve a guardar en la caché con la misma clave.
+    """
+    global y_pred
+    y_pred = modelo_reg.predict(X_test)
+    clave, guardado = _modelo_reg_guardado
+    guardado.update(modelo=modelo_reg, y_pred=y_pred, metricas=tuple(_metricas_regresion(y_test, y_pred).values()))
+    guardar_modelo_cacheado("regresion", clave, guardado)
 
 # ============================================================
 # INICIALIZACIÓN COMPLETA DEL SPRINT 3 (solo 1 vez)
@@ -521,7 +2707,7 @@ def build_preprocessor():
 def inicializar_sprint3():
     """
     Prepara todo el contexto ML:
-    - Carga BD (Productos, Detalle, Dataset Mensual)
+    - Toma del contexto compartido Productos, Detalle y Dataset Mensual
     - Merge
     - Limpieza
     - Preprocesamiento
@@ -533,7 +2719,7 @@ def inicializar_sprint3():
     global _sprint3_inicializado
     global df_prod_ml, df_detalle_ml, df_mensual_ml, df_ml
     global modelo_reg, X_train, X_test, y_train, y_test, y_pred
-    global q1, q2, df_clf
+    global q1, q2, df_clf, _modelo_reg_guardado
 
     if _sprint3_inicializado:
         return
@@ -541,9 +2727,10 @@ def inicializar_sprint3():
     print("\nInicializando contexto de Machine Learning (Sprint 3)...")
 
     # --- 1. CARGA DE DATOS ---
-    df_prod_ml = pd.read_excel(RUTA_EXCEL, sheet_name="Productos")
-    df_detalle_ml = pd.read_excel(RUTA_EXCEL, sheet_name="Detalle_Ventas")
-    df_mensual_ml = pd.read_excel(RUTA_EXCEL, sheet_name="Dataset_Mensual")
+    # Reutiliza las hojas que main() ya cargó; solo se lee lo que falte
+    df_prod_ml, df_detalle_ml, df_mensual_ml = contexto_datos.cargar(
+        ["Productos", "Detalle_Ventas", "Dataset_Mensual"]
+    )
 
     # Normalizar nombres
     if "id_product" in df_mensual_ml.columns:
@@ -567,78 +2754,227 @@ def inicializar_sprint3():
 
     df_ml = df_ml.dropna().copy()
 
-    df_ml["porcentaje_margen"] = (
-        df_ml["porcentaje_margen"]
-        .astype(str)
-        .str.replace("%", "")
-        .str.replace(",", ".")
-        .astype(float)
-    )
+    df_ml["porcentaje_margen"] = porcentaje_a_float(df_ml["porcentaje_margen"])
 
     # --- 3. MODELO DE REGRESIÓN ---
-    X_cols = [
-        "anio", "mes", "categoria_general", "precio_unitario",
-        "costo_producto", "margen_ganancia",
-        "porcentaje_margen", "stock_actual", "stock_minimo"
-    ]
-    y_col = "cantidad"
+    X_cols = X_COLS_REGRESION
+    y_col = Y_COL_REGRESION
 
     X = df_ml[X_cols]
     y = df_ml[y_col]
 
-    modelo_reg = Pipeline(
-        [
-            ("prep", build_preprocessor()),
-            ("gbr", GradientBoostingRegressor(
-                n_estimators=200,
-                learning_rate=0.05,
-                max_depth=5,
-                subsample=0.9,
-                random_state=42
-            ))
-        ]
-    )
+    # Mismos datos de entrada y misma configuración => mismo modelo: se recupera
+    configuracion = configuracion_regresion()
+    clave = clave_modelo([df_mensual_ml, df_prod_ml], configuracion)
+    guardado = cargar_modelo_cacheado("regresion", clave)
 
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42
-    )
+    if guardado is not None:
+        print("✔ Modelo de regresión recuperado de la caché (datos y configuración sin cambios).")
+    else:
+        # Mismos productos y configuración, solo meses nuevos => se extiende el modelo anterior
+        clave_base = clave_modelo([df_prod_ml], configuracion)
+        # (los modelos por categoría se reentrenan por shard, no con warm start)
+        previo = None
+        if REENTRENAMIENTO_INCREMENTAL and not MODELO_POR_CATEGORIA:
+            previo = ultimo_modelo_cacheado("regresion")
+        if previo is not None and previo.get("clave_base") == clave_base:
+            guardado = reentrenar_incremental(previo, X, y)
+
+        if guardado is None:
+            X_train, X_test, y_train, y_test = train_test_split(
+                X, y, **PARAMETROS_PARTICION
+            )
 
-    modelo_reg.fit(X_train, y_train)
-    y_pred = modelo_reg.predict(X_test)
+            if MODELO_POR_CATEGORIA:
+                modelo_reg = entrenar_modelo_por_categoria(X_train, y_train)
+            else:
+                modelo_reg = construir_modelo_regresion()
+                modelo_reg.fit(X_train, y_train)
+            y_pred = modelo_reg.predict(X_test)
+
+            guardado = {
+                "modelo": modelo_reg,
+                "X_train": X_train, "X_test": X_test,
+                "y_train": y_train, "y_test": y_test,
+                "y_pred": y_pred,
+                "metricas": tuple(_metricas_regresion(y_test, y_pred).values()),
+                "configuracion": configuracion,
+            }
+
+        guardado.update(
+            clave_base=clave_base,
+            periodos=sorted(indice_periodo(df_mensual_ml).unique().tolist()),
+            huella_historico=huella_tabla(df_mensual_ml)
+        )
+        guardar_modelo_cacheado("regresion", clave, guardado)
 
-    # --- Mostrar métricas en consola ---
-    mae = mean_absolute_error(y_test, y_pred)
-    rmse = sqrt(mean_squared_error(y_test, y_pred))
-    r2 = r2_score(y_test, y_pred)
+    _modelo_reg_guardado = (clave, guardado)
+    modelo_reg = guardado["modelo"]
+    X_train, X_test = guardado["X_train"], guardado["X_test"]
+    y_train, y_test = guardado["y_train"], guardado["y_test"]
+    y_pred = guardado["y_pred"]
+    mae, rmse, r2 = guardado["metricas"]
 
+    # --- Mostrar métricas en consola ---
     print("\n=== MÉTRICAS MODELO REGRESIÓN ===")
     print(f"MAE  : {mae:.4f}")
     print(f"RMSE : {rmse:.4f}")
     print(f"R²   : {r2:.4f}")
 
     # --- 4. CLASIFICACIÓN ---
-    q1 = y_train.quantile(0.30)
-    q2 = y_train.quantile(0.80)
+    if UMBRALES_APROXIMADOS:
+        # Mismo umbral, acumulado por bloques con el boceto de cuantiles
+        boceto = BocetoCuantiles()
+        for inicio in range(0, len(y_train), TAMANO_BLOQUE):
+            boceto.agregar(y_train.iloc[inicio:inicio + TAMANO_BLOQUE].to_numpy(dtype=float))
+        q1 = boceto.cuantil(CUANTIL_NIVEL_BAJO)
+        q2 = boceto.cuantil(CUANTIL_NIVEL_TOP)
+    else:
+        q1 = y_train.quantile(CUANTIL_NIVEL_BAJO)
+        q2 = y_train.quantile(CUANTIL_NIVEL_TOP)
+
+    # Las etiquetas se agregan como columnas category sobre df_ml (sin copiarlo)
+    df_ml["nivel_ventas"] = etiquetar_nivel_ventas(df_ml[y_col], q1, q2)
+    df_ml["riesgo_stock"] = etiquetar_riesgo_stock(df_ml["stock_actual"], df_ml["stock_minimo"])
+    df_clf = df_ml
+
+    _sprint3_inicializado = True
+    print("\nContexto ML del Sprint 3 inicializado correctamente.\n")
+
+# ============================================================
+# REGLAS DE ETIQUETADO (vectorizadas, salida category)
+# ============================================================
+
+def etiquetar_por_reglas(condiciones, etiquetas, defecto, orden):
+    """
+    Como np.select pero sin crear strings por fila: elige el código de la
+    primera condición que se cumple (o el de `defecto`) y arma un
+    Categorical con las categorías en `orden`.
+    """
+    codigos = np.select(
+        [np.asarray(condicion, dtype=bool) for condicion in condiciones],
+        [orden.index(etiqueta) for etiqueta in etiquetas],
+        default=orden.index(defecto)
+    )
+    return pd.Categorical.from_codes(codigos, categories=orden)
 
-    df_clf = df_ml.copy()
 
-    df_clf["nivel_ventas"] = np.select(
-        [df_clf[y_col] >= q2, df_clf[y_col] <= q1],
+def etiquetar_nivel_ventas(cantidad, q1, q2):
+    """TOP (>= q2) / MEDIO / BAJO (<= q1)."""
+    return etiquetar_por_reglas(
+        [cantidad >= q2, cantidad <= q1],
         ["TOP", "BAJO"],
-        default="MEDIO"
+        defecto="MEDIO",
+        orden=["TOP", "MEDIO", "BAJO"]
     )
 
-    df_clf["riesgo_stock"] = df_clf.apply(
-        lambda row: (
-            "ALTO_RIESGO" if row["stock_actual"] < row["stock_minimo"]
-            else "MEDIO_RIESGO" if row["stock_actual"] < row["stock_minimo"] * 1.5
-            else "SIN_RIESGO"
-        ),
-        axis=1
+
+def etiquetar_riesgo_stock(stock_actual, stock_minimo, umbral=None):
+    """ALTO_RIESGO (bajo el mínimo) / MEDIO_RIESGO (bajo mínimo * umbral) / SIN_RIESGO."""
+    umbral = UMBRAL_RIESGO_MEDIO if umbral is None else umbral
+    return etiquetar_por_reglas(
+        [stock_actual < stock_minimo, stock_actual < stock_minimo * umbral],
+        ["ALTO_RIESGO", "MEDIO_RIESGO"],
+        defecto="SIN_RIESGO",
+        orden=["ALTO_RIESGO", "MEDIO_RIESGO", "SIN_RIESGO"]
     )
 
-    _sprint3_inicializado = True
-    print("\nContexto ML del Sprint 3 inicializado correctamente.\n")
+# ============================================================
+# PREDICCIÓN POR LOTE (todos los productos × próximos meses)
+# ============================================================
+
+# Meses a futuro por defecto y archivo de salida (sin extensión)
+HORIZONTE_PREDICCION_MESES = 3
+RUTA_PREDICCIONES = os.path.join(os.getcwd(), "PREDICCION_DEMANDA_AURELION")
+
+
+def construir_lote_prediccion(meses=None):
+    """
+    Matriz de features de cada id_producto × cada uno de los próximos
+    `meses` meses (contados desde el último anio/mes de Dataset_Mensual),
+    armada de una vez con repeat/tile, sin bucles por producto.
+    """
+    meses = HORIZONTE_PREDICCION_MESES if meses is None else meses
+    columnas_producto = [col for col in X_COLS_REGRESION if col not in ("anio", "mes")]
+
+    productos = df_prod_ml[["id_producto", "nombre_producto", *columnas_producto]]
+    productos = productos.assign(porcentaje_margen=porcentaje_a_float(productos["porcentaje_margen"]))
+    productos = productos.dropna().reset_index(drop=True)
+
+    # Meses como índice absoluto (anio * 12 + mes - 1) para cruzar fin de año
+    ultimo = int(indice_periodo(df_mensual_ml).max())
+    periodos = ultimo + np.arange(1, meses + 1)
+
+    lote = productos.iloc[np.repeat(np.arange(len(productos)), meses)].reset_index(drop=True)
+    return lote.assign(
+        anio=np.tile(periodos // 12, len(productos)),
+        mes=np.tile(periodos % 12 + 1, len(productos))
+    )
+
+
+def predecir_demanda_lote(meses=None, tamano_bloque=None, ruta=None):
+    """
+    Puntúa con modelo_reg la demanda de todo el catálogo para los próximos
+    `meses`, por bloques de `tamano_bloque` filas, y la escribe a disco
+    (Parquet o, sin pyarrow, CSV).
+    Devuelve (df_predicciones, ruta_archivo).
+    """
+    inicializar_sprint3()
+    tamano_bloque = TAMANO_BLOQUE if tamano_bloque is None else tamano_bloque
+    ruta = RUTA_PREDICCIONES if ruta is None else ruta
+
+    lote = construir_lote_prediccion(meses)
+    X_lote = lote[X_COLS_REGRESION]
+    prediccion = np.concatenate([
+        modelo_reg.predict(X_lote.iloc[inicio:inicio + tamano_bloque])
+        for inicio in range(0, len(X_lote), tamano_bloque)
+    ]) if len(X_lote) else np.empty(0)
+
+    df_pred = lote[["id_producto", "nombre_producto", "categoria_general", "anio", "mes"]].assign(
+        # Una demanda negativa no tiene sentido para reponer
+        demanda_estimada=np.clip(prediccion, 0, None)
+    )
+
+    if PARQUET_DISPONIBLE:
+        ruta_archivo = f"{ruta}.parquet"
+        df_pred.to_parquet(ruta_archivo, index=False, compression="zstd")
+    else:
+        ruta_archivo = f"{ruta}.csv"
+        df_pred.to_csv(ruta_archivo, index=False, chunksize=TAMANO_BLOQUE)
+    return df_pred, ruta_archivo
+
+
+def sprint3_prediccion_lote():
+    inicializar_sprint3()
+    limpiar_pantalla()
+
+    print("📦 PREDICCIÓN DE DEMANDA POR LOTE – TODOS LOS PRODUCTOS\n")
+
+    respuesta = input(f"¿Cuántos meses a futuro? (ENTER = {HORIZONTE_PREDICCION_MESES}): ").strip()
+    meses = int(respuesta) if respuesta.isdigit() and int(respuesta) > 0 else HORIZONTE_PREDICCION_MESES
+
+    inicio = time.perf_counter()
+    df_pred, ruta_archivo = predecir_demanda_lote(meses)
+    segundos = time.perf_counter() - inicio
+
+    print(f"\n✔ {len(df_pred)} predicciones ({df_pred['id_producto'].nunique()} productos × {meses} meses) "
+          f"en {segundos:.2f} s")
+    print(f"Archivo generado:\n{ruta_archivo}\n")
+
+    total_por_mes = df_pred.groupby(["anio", "mes"])["demanda_estimada"].sum().round(0)
+    print("Demanda total estimada por mes:")
+    print(total_por_mes.to_string())
+
+    primer_mes = df_pred[(df_pred["anio"] == df_pred["anio"].iloc[0]) & (df_pred["mes"] == df_pred["mes"].iloc[0])]
+    print("\nTop 10 productos del próximo mes:")
+    print(
+        primer_mes.nlargest(10, "demanda_estimada")[["id_producto", "nombre_producto", "demanda_estimada"]]
+        .round({"demanda_estimada": 1})
+        .to_string(index=False)
+    )
+    print()
+
+    pausar_y_volver()
 
 # ============================================================
 # FUNCIÓN UNIVERSAL PARA TEXTO DE INTERPRETACIÓN EN GRÁFICAS
@@ -730,37 +3066,16 @@ def sprint3_prediccion_diciembre():
 
     print("📈 TENDENCIA MENSUAL + PREDICCIÓN DICIEMBRE\n")
 
-    df_mes = (
-        df_mensual_ml.groupby(["anio", "mes"])
-        .agg(
-            cantidad_total=("cantidad", "sum"),
-            precio_promedio=("precio", "mean"),
-            costo_promedio=("costo", "mean")
-        )
-        .reset_index()
-    )
-
-    df_mes["fecha"] = pd.to_datetime(
-        df_mes["anio"].astype(str) + "-" + df_mes["mes"].astype(str) + "-01"
-    )
-    df_mes = df_mes.sort_values("fecha")
-    df_mes["mes_num"] = np.arange(1, len(df_mes) + 1)
-    df_mes["rolling_3"] = df_mes["cantidad_total"].rolling(3).mean().bfill()
+    df_mes = construir_serie_mensual()
 
-    X_m = df_mes[["mes_num", "rolling_3", "precio_promedio", "costo_promedio"]]
-    y_m = df_mes["cantidad_total"]
+    X_m = df_mes[X_COLS_MENSUAL]
+    y_m = df_mes[Y_COL_MENSUAL]
 
     X_m_train, X_m_test, y_m_train, y_m_test = train_test_split(
         X_m, y_m, test_size=0.2, random_state=42
     )
 
-    modelo_mensual = GradientBoostingRegressor(
-        n_estimators=300,
-        learning_rate=0.05,
-        max_depth=4,
-        subsample=0.9,
-        random_state=42
-    )
+    modelo_mensual = construir_modelo_mensual()
     modelo_mensual.fit(X_m_train, y_m_train)
 
     anio_pred = df_mes["anio"].max()
@@ -998,7 +3313,7 @@ def sprint3_top_criticos():
     plt.style.use("seaborn-v0_8-talk")
 
     df_dem_stock = (
-        df_clf.groupby(["id_producto", "nivel_ventas"])["cantidad"]
+        df_clf.groupby(["id_producto", "nivel_ventas"], observed=True)["cantidad"]
         .sum()
         .reset_index()
         .merge(
@@ -1011,7 +3326,7 @@ def sprint3_top_criticos():
     df_top_crit = df_dem_stock[
         (df_dem_stock["nivel_ventas"] == "TOP") &
         (df_dem_stock["stock_minimo"] > 0) &
-        (df_dem_stock["stock_actual"] < df_dem_stock["stock_minimo"] * 1.2)
+        (df_dem_stock["stock_actual"] < df_dem_stock["stock_minimo"] * UMBRAL_TOP_CRITICO)
     ].sort_values("cantidad", ascending=False).head(15)
 
     if len(df_top_crit) > 0:
@@ -1134,6 +3449,97 @@ def matriz_regresion():
     mostrar_metricas_regresion()
 
 
+def sprint3_benchmark_motores():
+    """
+    Entrena cada motor de regresión sobre la misma partición train/test
+    y compara tiempo de ajuste y métricas.
+    """
+    inicializar_sprint3()
+    limpiar_pantalla()
+
+    print("⏱ COMPARATIVA DE MOTORES DE ENTRENAMIENTO (misma partición train/test)\n")
+
+    filas = []
+    for motor, nombre in MOTORES_REGRESION.items():
+        print(f"Entrenando {nombre}...")
+        modelo = construir_modelo_regresion(motor)
+        inicio = time.perf_counter()
+        modelo.fit(X_train, y_train)
+        segundos = time.perf_counter() - inicio
+        prediccion = modelo.predict(X_test)
+        filas.append({
+            "Motor": nombre,
+            "Ajuste (s)": segundos,
+            **_metricas_regresion(y_test, prediccion),
+        })
+
+    print()
+    print(pd.DataFrame(filas).to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+    print(f"\nMotor activo: {MOTORES_REGRESION[MOTOR_REGRESION]} (variable AURELION_MOTOR_REGRESION)\n")
+
+    pausar_y_volver()
+
+
+def sprint3_modelos_por_categoria():
+    """
+    Métricas por shard y totales de los modelos por categoría. Si el modelo
+    activo no es por categoría, los shards se entrenan en este momento
+    sobre la misma partición. Permite reentrenar una sola categoría.
+    """
+    inicializar_sprint3()
+    limpiar_pantalla()
+
+    print("🧩 MODELOS POR CATEGORÍA – MÉTRICAS POR SHARD\n")
+
+    if isinstance(modelo_reg, ModeloPorCategoria):
+        modelo = modelo_reg
+    else:
+        print("Entrenando un modelo por categoría (procesos en paralelo)...")
+        inicio = time.perf_counter()
+        modelo = entrenar_modelo_por_categoria(X_train, y_train)
+        print(f"Shards entrenados en {time.perf_counter() - inicio:.2f} s\n")
+
+    formato = {"float_format": lambda x: f"{x:.4f}", "index": False}
+    print(metricas_por_categoria(modelo, X_test, y_test).to_string(**formato))
+    if not isinstance(modelo_reg, ModeloPorCategoria):
+        metricas = _metricas_regresion(y_test, y_pred)
+        print(f"\nModelo global actual → MAE {metricas['MAE']:.4f} | R² {metricas['R²']:.4f}")
+
+    categoria = input("\nCategoría a reentrenar (ENTER para omitir): ").strip()
+    if categoria in modelo.modelos:
+        reentrenar_categoria(modelo, categoria, X_train, y_train)
+        if modelo is modelo_reg:
+            # Métricas (opción 5, PDF) y caché quedan al día con el shard nuevo
+            actualizar_modelo_reg()
+        print(f"\n✔ Shard '{categoria}' reentrenado en {modelo.segundos[categoria]:.2f} s (el resto sin cambios).\n")
+        print(metricas_por_categoria(modelo, X_test, y_test).to_string(**formato))
+    elif categoria:
+        print("⚠ Esa categoría no tiene modelo.")
+
+    pausar_y_volver()
+
+
+def sprint3_validacion_temporal():
+    """Validación cruzada de origen móvil de modelo_reg y modelo_mensual."""
+    inicializar_sprint3()
+    limpiar_pantalla()
+
+    print(f"🧪 VALIDACIÓN CRUZADA TEMPORAL ({PLIEGUES_CV} pliegues, "
+          f"{HORIZONTE_CV_MESES} meses de test por pliegue)\n")
+
+    titulo_regresion = "Modelo de regresión (modelo_reg" + (", por categoría)" if MODELO_POR_CATEGORIA else ")")
+    for modelo, titulo in (("regresion", titulo_regresion),
+                           ("mensual", "Modelo mensual (modelo_mensual)")):
+        inicio = time.perf_counter()
+        df_pliegues, resumen = validacion_cruzada_temporal(modelo)
+        print(f"--- {titulo} · {time.perf_counter() - inicio:.2f} s ---")
+        print(df_pliegues.to_string(float_format=lambda x: f"{x:.4f}"))
+        print("  ".join(f"{metrica}: {media:.4f} ± {desvio:.4f}" for metrica, (media, desvio) in resumen.items()))
+        print()
+
+    pausar_y_volver()
+
+
 # ============================================================
 # 5.6 – EXPORTAR MODELO ML A PDF (CARPETA DESCARGAS)
 # ============================================================
@@ -1255,11 +3661,23 @@ def mostrar_submenu_sprint3():
         print(AMARILLO + "\n[📝] EXPORTACIÓN" + RESET)
         print("  6. Exportar reporte ML en PDF")
 
-        print("\n↩ 7. Volver al menú principal")
+        print(AZUL + "\n[⏱] RENDIMIENTO" + RESET)
+        print("  7. Comparar motores de entrenamiento")
+
+        print(AZUL + "\n[📦] REPOSICIÓN" + RESET)
+        print("  8. Predicción por lote – todos los productos")
+
+        print(AZUL + "\n[🧩] MODELOS POR CATEGORÍA" + RESET)
+        print("  9. Métricas por shard y reentrenar una categoría")
+
+        print(AZUL + "\n[🧪] VALIDACIÓN" + RESET)
+        print("  10. Validación cruzada temporal (origen móvil)")
+
+        print("\n↩ 11. Volver al menú principal")
         print("=" * 60)
 
         try:
-            op = int(input("Seleccione una opción (1-7): "))
+            op = int(input("Seleccione una opción (1-11): "))
         except ValueError:
             print("⚠ Debe ingresar un número válido.")
             continue
@@ -1277,6 +3695,14 @@ def mostrar_submenu_sprint3():
         elif op == 6:
             exportar_modelo_ml()
         elif op == 7:
+            sprint3_benchmark_motores()
+        elif op == 8:
+            sprint3_prediccion_lote()
+        elif op == 9:
+            sprint3_modelos_por_categoria()
+        elif op == 10:
+            sprint3_validacion_temporal()
+        elif op == 11:
             limpiar_pantalla()
             break
         else:
@@ -1366,7 +3792,23 @@ def main():
     limpiar_pantalla()
     print("Cargando Proyecto Aurelion...\n")
 
-    df_cliente, df_detalle, df_producto, df_ventas, df_map = cargar_datos()
+    # Las hojas se leen recién cuando una opción del menú las necesita
+    datos = contexto_datos
+
+    # Tablas limpiadas en esta sesión (None = todavía se usa la hoja original;
+    # fuera de memoria, Ventas y Detalle_Ventas guardan la carpeta de sus partes)
+    df_cliente = df_detalle = df_producto = df_ventas = None
+
+    # Hojas cuya memoria (antes/después del esquema) ya se mostró
+    memoria_reportada = set()
+
+    # Mientras el usuario lee el menú se van leyendo las hojas grandes
+    if PRECARGA_SEGUNDO_PLANO:
+        # Fuera de memoria, Ventas y Detalle_Ventas no se cargan enteras
+        datos.precargar([
+            hoja for hoja in HOJAS_PRECARGA
+            if not (LIMPIEZA_FUERA_DE_MEMORIA and hoja in HOJAS_FUERA_DE_MEMORIA)
+        ])
 
     while True:
         mostrar_menu()
@@ -1385,25 +3827,44 @@ def main():
         if opcion == 1:
             limpiar_pantalla()
             print("📂 Limpieza y análisis de CLIENTES\n")
-            df_cliente, _ = limpiar_analizar_clientes(df_cliente, mostrar_graficos=True)
+            df_cliente, _ = limpiar_analizar_clientes(
+                datos.clientes if df_cliente is None else df_cliente,
+                mostrar_graficos=True
+            )
+            _reportar_memoria_nuevas(memoria_reportada)
             pausar_y_volver()
 
         elif opcion == 2:
             limpiar_pantalla()
             print("📂 Limpieza y análisis de PRODUCTOS\n")
-            df_producto, _ = limpiar_analizar_productos(df_producto, df_map, mostrar_graficos=True)
+            df_producto, _ = limpiar_analizar_productos(
+                datos.productos if df_producto is None else df_producto,
+                datos.mapeo,
+                mostrar_graficos=True
+            )
+            _reportar_memoria_nuevas(memoria_reportada)
             pausar_y_volver()
 
         elif opcion == 3:
             limpiar_pantalla()
             print("📂 Limpieza y análisis de VENTAS\n")
-            df_ventas, _ = limpiar_analizar_ventas(df_ventas, mostrar_graficos=True)
+            df_ventas, _ = limpiar_analizar_ventas(
+                None if LIMPIEZA_FUERA_DE_MEMORIA else (datos.ventas if df_ventas is None else df_ventas),
+                mostrar_graficos=True,
+                fuera_de_memoria=LIMPIEZA_FUERA_DE_MEMORIA
+            )
+            _reportar_memoria_nuevas(memoria_reportada)
             pausar_y_volver()
 
         elif opcion == 4:
             limpiar_pantalla()
             print("📂 Limpieza y análisis de DETALLE DE VENTA\n")
-            df_detalle, _ = limpiar_analizar_detalle(df_detalle, mostrar_graficos=True)
+            df_detalle, _ = limpiar_analizar_detalle(
+                None if LIMPIEZA_FUERA_DE_MEMORIA else (datos.detalle if df_detalle is None else df_detalle),
+                mostrar_graficos=True,
+                fuera_de_memoria=LIMPIEZA_FUERA_DE_MEMORIA
+            )
+            _reportar_memoria_nuevas(memoria_reportada)
             pausar_y_volver()
 
         # -----------------------------
@@ -1417,9 +3878,28 @@ def main():
         # -----------------------------
         elif opcion == 6:
             limpiar_pantalla()
+            formato = elegir_formato_exportacion()
             print("📤 Exportando BD limpia…")
-            ruta = exportar_bd_limpia(df_cliente, df_detalle, df_producto, df_ventas, df_map)
+            if LIMPIEZA_FUERA_DE_MEMORIA:
+                # Se exportan desde sus partes en disco, sin cargarlas enteras
+                if df_ventas is None:
+                    df_ventas, _ = limpiar_fuera_de_memoria("Ventas")
+                if df_detalle is None:
+                    df_detalle, _ = limpiar_fuera_de_memoria("Detalle_Ventas")
+            # Lee en una sola pasada las hojas que aún no se habían pedido
+            pendientes = {"Clientes": df_cliente, "Detalle_Ventas": df_detalle,
+                          "Productos": df_producto, "Ventas": df_ventas}
+            datos.cargar([hoja for hoja in HOJAS_DEMO if pendientes.get(hoja) is None])
+            ruta = exportar_bd_limpia(
+                datos.clientes if df_cliente is None else df_cliente,
+                datos.detalle if df_detalle is None else df_detalle,
+                datos.productos if df_producto is None else df_producto,
+                datos.ventas if df_ventas is None else df_ventas,
+                datos.mapeo,
+                formato=formato
+            )
             print(f"\n✔ Base de datos exportada en:\n{ruta}")
+            _reportar_memoria_nuevas(memoria_reportada)
             pausar_y_volver()
 
         # -----------------------------
@@ -1443,6 +3923,7 @@ def main():
         elif opcion == 10:
             print("\n⚠ Opción no válida. Seleccione un número del 1 al 10.")
             print("\nSaliendo del sistema. ¡Gracias por usar PROYECTO AURELION!")
+            datos.detener_precarga()
             break
 if __name__ == "__main__":
     main()
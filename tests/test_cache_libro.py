@@ -0,0 +1,108 @@
+# ============================================================
+# CACHÉ LOCAL DEL LIBRO REMOTO – contra un http.server local
+# ============================================================
+
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import Aurelion_demo_final as aurelion  # noqa: E402
+
+
+class _Servidor:
+    """Sirve un único libro con ETag y registra los códigos de respuesta."""
+
+    def __init__(self):
+        self.contenido = b"libro v1"
+        self.etag = '"v1"'
+        self.codigos = []
+
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.headers.get("If-None-Match") == servidor.etag:
+                    servidor.codigos.append(304)
+                    self.send_response(304)
+                    self.send_header("ETag", servidor.etag)
+                    self.end_headers()
+                    return
+                servidor.codigos.append(200)
+                self.send_response(200)
+                self.send_header("ETag", servidor.etag)
+                self.send_header("Content-Length", str(len(servidor.contenido)))
+                self.end_headers()
+                self.wfile.write(servidor.contenido)
+
+            def log_message(self, *args):
+                pass
+
+        self.http = ThreadingHTTPServer(("127.0.0.1", 0), Manejador)
+        self.url = f"http://127.0.0.1:{self.http.server_address[1]}/BD.xlsx"
+        self.hilo = threading.Thread(target=self.http.serve_forever, daemon=True)
+        self.hilo.start()
+
+    def publicar(self, contenido, etag):
+        self.contenido, self.etag = contenido, etag
+
+    def detener(self):
+        self.http.shutdown()
+        self.http.server_close()
+
+
+@pytest.fixture
+def servidor():
+    srv = _Servidor()
+    yield srv
+    srv.detener()
+
+
+@pytest.fixture(autouse=True)
+def cache_aislada(tmp_path, monkeypatch):
+    monkeypatch.setattr(aurelion, "CARPETA_CACHE", tmp_path / "cache")
+    monkeypatch.setattr(aurelion, "_libros_validados", {})
+
+
+def _nuevo_proceso(monkeypatch):
+    # Simula un arranque nuevo: solo queda la caché en disco
+    monkeypatch.setattr(aurelion, "_libros_validados", {})
+
+
+def test_revalida_con_etag_y_descarga_solo_si_cambia(servidor, monkeypatch):
+    ruta_v1, sha_v1 = aurelion.obtener_libro_local(servidor.url, offline=False)
+    assert servidor.codigos == [200]
+    assert ruta_v1.read_bytes() == b"libro v1"
+    assert ruta_v1.name == f"{sha_v1}.xlsx"
+
+    _nuevo_proceso(monkeypatch)
+    assert aurelion.obtener_libro_local(servidor.url, offline=False) == (ruta_v1, sha_v1)
+    assert servidor.codigos == [200, 304]
+
+    servidor.publicar(b"libro v2", '"v2"')
+    _nuevo_proceso(monkeypatch)
+    ruta_v2, sha_v2 = aurelion.obtener_libro_local(servidor.url, offline=False)
+    assert servidor.codigos == [200, 304, 200]
+    assert sha_v2 != sha_v1
+    assert ruta_v2.read_bytes() == b"libro v2"
+    assert not ruta_v1.exists()
+
+
+def test_sin_red_usa_la_ultima_copia(servidor, monkeypatch):
+    copia = aurelion.obtener_libro_local(servidor.url, offline=False)
+    servidor.detener()
+
+    _nuevo_proceso(monkeypatch)
+    assert aurelion.obtener_libro_local(servidor.url, offline=False) == copia
+
+    _nuevo_proceso(monkeypatch)
+    assert aurelion.obtener_libro_local(servidor.url, offline=True) == copia
+
+
+def test_offline_sin_copia_falla(servidor):
+    with pytest.raises(FileNotFoundError):
+        aurelion.obtener_libro_local(servidor.url, offline=True)
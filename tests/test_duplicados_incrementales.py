@@ -0,0 +1,52 @@
+# ============================================================
+# ÍNDICE PERSISTENTE DE DUPLICADOS – historial que crece o cambia
+# ============================================================
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import Aurelion_demo_final as aurelion  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def cache_aislada(tmp_path, monkeypatch):
+    monkeypatch.setattr(aurelion, "CARPETA_CACHE", tmp_path / "cache")
+
+
+def _historial(filas):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "id_venta": rng.integers(0, filas // 4, filas),
+        "medio_pago": pd.Categorical(rng.choice(["efectivo", "qr", "tarjeta"], filas)),
+    })
+
+
+def test_filas_agregadas_solo_cuentan_duplicados_nuevos():
+    df = _historial(5_000)
+    mascara, _ = aurelion.deduplicar_incremental(df, "Ventas")
+    assert np.array_equal(mascara, df.duplicated().to_numpy())
+
+    crecido = pd.concat([df, df.iloc[:10]], ignore_index=True)
+    mascara, nuevos = aurelion.deduplicar_incremental(crecido, "Ventas")
+    assert np.array_equal(mascara, crecido.duplicated().to_numpy())
+    assert nuevos == 10
+
+
+def test_fila_editada_del_historial_reconstruye_el_indice():
+    df = _historial(5_000)
+    aurelion.deduplicar_incremental(df, "Ventas")
+
+    # Una fila duplicada entre puntos de una muestra espaciada pasa a ser única
+    editado = df.copy()
+    duplicadas = np.flatnonzero(df.duplicated().to_numpy()[:2_500])
+    posicion = int(duplicadas[duplicadas % 5 == 3][-1])
+    editado.loc[posicion, "id_venta"] = 10**9
+    mascara, _ = aurelion.deduplicar_incremental(editado, "Ventas")
+    assert np.array_equal(mascara, editado.duplicated().to_numpy())
+    assert mascara.sum() == df.duplicated().sum() - 1